@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
 import click
 from rich.console import Console
-from rich.table import Table
-from rich.panel import Panel
-from rich.progress import track
 from src.services.catalog import CatalogService
 from src.services.google_auth import GoogleAuthService
 from src.utils.logger import logger
-from src.utils.config import GEMINI_API_KEY, INSTAGRAM_USERNAME
+from src.utils import config
 
 console = Console()
 
+# Cor de exibição de cada status na listagem
+_STATUS_COLORS = {
+    'pendente': 'yellow',
+    'publicado': 'green',
+    'vendido': 'blue'
+}
+
 
 @click.group()
 def cli():
@@ -29,7 +36,7 @@ def setup():
     
     try:
         # Testa Google APIs
-        auth_service = GoogleAuthService()
+        auth_service = GoogleAuthService.get_instance()
         if auth_service.test_connection():
             console.print("[green]✅ Google APIs configuradas com sucesso![/green]")
         else:
@@ -38,13 +45,13 @@ def setup():
         
         # Verifica configurações
         console.print("\n[bold]📋 Configurações atuais:[/bold]")
-        console.print(f"  • Gemini API: {'✅ Configurada' if GEMINI_API_KEY else '❌ Não configurada'}")
-        console.print(f"  • Instagram: {'✅ Configurado' if INSTAGRAM_USERNAME else '❌ Não configurado'}")
+        console.print(f"  • Gemini API: {'✅ Configurada' if config.GEMINI_API_KEY else '❌ Não configurada'}")
+        console.print(f"  • Instagram: {'✅ Configurado' if config.INSTAGRAM_USERNAME else '❌ Não configurado'}")
         
-        if not GEMINI_API_KEY:
+        if not config.GEMINI_API_KEY:
             console.print("\n[yellow]⚠️  Configure GEMINI_API_KEY no arquivo .env para análise de imagens[/yellow]")
         
-        if not INSTAGRAM_USERNAME:
+        if not config.INSTAGRAM_USERNAME:
             console.print("[yellow]⚠️  Configure credenciais do Instagram no arquivo .env para publicação[/yellow]")
         
     except Exception as e:
@@ -53,13 +60,14 @@ def setup():
 
 @cli.command()
 @click.option('--limit', '-l', type=int, help='Número máximo de discos para processar')
-def scan(limit):
+@click.option('--force', is_flag=True, help='Reprocessa discos já catalogados')
+def scan(limit, force):
     """📸 Escaneia imagens do Drive e cataloga discos"""
     console.print("\n[bold blue]📸 Iniciando escaneamento e catalogação...[/bold blue]\n")
     
     try:
         catalog = CatalogService()
-        count = catalog.scan_and_catalog(limit)
+        count = catalog.scan_and_catalog(limit, force)
         
         if count > 0:
             console.print(f"\n[green]✅ {count} discos catalogados com sucesso![/green]")
@@ -93,8 +101,11 @@ def publish(limit, dry_run):
         
         if dry_run:
             # Mostra o que seria publicado
-            for i, vinyl in enumerate(pending[:limit] if limit else pending, 1):
-                console.print(f"{i}. {vinyl['Nome']} - {vinyl['Artista']}")
+            lines = [
+                f"{i}. {vinyl['Nome']} - {vinyl['Artista']}"
+                for i, vinyl in enumerate(islice(pending, limit or None), 1)
+            ]
+            console.print("\n".join(lines))
         else:
             # Publica de verdade
             count = catalog.publish_pending(limit)
@@ -108,6 +119,28 @@ def publish(limit, dry_run):
         console.print(f"[red]❌ Erro: {e}[/red]")
 
 
+@lru_cache(maxsize=None)
+def _status_markup(status: str) -> str:
+    """Markup colorido do status (poucos valores distintos, calculado uma vez)"""
+    color = _STATUS_COLORS.get(status.lower(), 'white')
+    return f"[{color}]{status}[/{color}]"
+
+
+def _format_row(index: int, vinyl: dict) -> tuple:
+    """Converte um disco em uma linha da tabela de listagem"""
+    get = vinyl.get
+    
+    return (
+        str(index),
+        get('Nome', '-')[:30],
+        get('Artista', '-')[:20],
+        get('Ano', '-'),
+        get('Preço', '-'),
+        _status_markup(get('Status', '')),
+        get('Data Publicação', '-')
+    )
+
+
 @cli.command()
 @click.option('--status', '-s', type=click.Choice(['todos', 'pendente', 'publicado', 'vendido']), 
               default='todos', help='Filtrar por status')
@@ -128,6 +161,8 @@ def list(status, limit):
         if limit:
             vinyls = vinyls[:limit]
         
+        from rich.table import Table
+
         # Cria tabela
         table = Table(title=f"Discos Catalogados ({len(vinyls)} registros)")
         
@@ -139,22 +174,14 @@ def list(status, limit):
         table.add_column("Status", width=10)
         table.add_column("Publicado", width=16)
         
-        for i, vinyl in enumerate(vinyls, 1):
-            status_color = {
-                'pendente': 'yellow',
-                'publicado': 'green',
-                'vendido': 'blue'
-            }.get(vinyl.get('Status', '').lower(), 'white')
-            
-            table.add_row(
-                str(i),
-                vinyl.get('Nome', '-')[:30],
-                vinyl.get('Artista', '-')[:20],
-                vinyl.get('Ano', '-'),
-                vinyl.get('Preço', '-'),
-                f"[{status_color}]{vinyl.get('Status', '-')}[/{status_color}]",
-                vinyl.get('Data Publicação', '-')
-            )
+        # Monta todas as linhas antes de renderizar a tabela uma única vez
+        rows = [
+            _format_row(i, vinyl)
+            for i, vinyl in enumerate(vinyls, 1)
+        ]
+        
+        for row in rows:
+            table.add_row(*row)
         
         console.print(table)
         
@@ -172,7 +199,7 @@ def price(row, price):
     try:
         catalog = CatalogService()
         
-        if catalog.update_price(row, price):
+        if catalog.update_price(row, price) and catalog.flush():
             console.print(f"[green]✅ Preço atualizado para R$ {price:.2f} na linha {row}[/green]")
         else:
             console.print("[red]❌ Erro ao atualizar preço[/red]")
@@ -188,18 +215,21 @@ def stats():
     
     try:
         catalog = CatalogService()
-        all_vinyls = catalog.list_catalog()
+        statuses = catalog.statuses_lc()
         
-        if not all_vinyls:
+        if not statuses:
             console.print("[yellow]Nenhum disco catalogado ainda[/yellow]")
             return
         
         # Calcula estatísticas
-        total = len(all_vinyls)
-        pendentes = sum(1 for v in all_vinyls if v.get('Status', '').lower() == 'pendente')
-        publicados = sum(1 for v in all_vinyls if v.get('Status', '').lower() == 'publicado')
-        vendidos = sum(1 for v in all_vinyls if v.get('Status', '').lower() == 'vendido')
+        total = len(statuses)
+        counts = Counter(statuses)
+        pendentes = counts['pendente']
+        publicados = counts['publicado']
+        vendidos = counts['vendido']
         
+        from rich.panel import Panel
+
         # Cria painel de estatísticas
         stats_text = f"""
 [bold cyan]Total de Discos:[/bold cyan] {total}
@@ -222,6 +252,8 @@ def stats():
 @cli.command()
 def help():
     """❓ Exibe ajuda detalhada"""
+    from rich.panel import Panel
+
     help_text = """
 [bold cyan]🎵 Vinyl Instagram Bot - Guia de Uso[/bold cyan]
 
@@ -1,43 +1,83 @@
+import asyncio
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
+from src.services.google_auth import GoogleAuthService
 from src.services.google_drive import GoogleDriveService
 from src.services.google_sheets import GoogleSheetsService
 from src.services.gemini import GeminiService
 from src.services.instagram import InstagramService
-from src.utils.config import GEMINI_API_KEY, INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD
+from src.models.vinyl import Vinyl
+from src.utils import config
 from src.utils.logger import logger
 
+# Padrão para extrair file_id da URL do Drive
+_DRIVE_FILE_RE = re.compile(r'https://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)')
+
 
 class CatalogService:
     """Serviço principal para catalogação e publicação de discos"""
 
     def __init__(self):
-        self.drive_service = GoogleDriveService()
-        self.sheets_service = GoogleSheetsService()
-        self.gemini_service = GeminiService(GEMINI_API_KEY) if GEMINI_API_KEY else None
         self.instagram_service = None
 
-        # Inicializa planilha
-        self.sheets_service.initialize_sheet()
+        # Cache da planilha (uma leitura por comando) e preços aguardando envio
+        self._vinyls_cache: Optional[List[dict]] = None
+        self._by_status: Optional[Dict[str, List[dict]]] = None
+        self._statuses_lc: List[str] = []
+        self._status_queries: Dict[str, List[dict]] = {}
+        self._pending_prices: Dict[int, float] = {}
+
+    # Os clientes são criados no primeiro acesso: comandos que usam apenas
+    # a planilha não pagam autenticação do Drive nem configuração do Gemini
+
+    @cached_property
+    def auth_service(self) -> GoogleAuthService:
+        """Autenticação Google compartilhada entre Drive e Sheets"""
+        return GoogleAuthService.get_instance()
+
+    @cached_property
+    def drive_service(self) -> GoogleDriveService:
+        """Serviço do Google Drive"""
+        return GoogleDriveService(self.auth_service)
+
+    @cached_property
+    def sheets_service(self) -> GoogleSheetsService:
+        """Serviço do Google Sheets, com a planilha inicializada no primeiro acesso"""
+        sheets_service = GoogleSheetsService(self.auth_service)
+        sheets_service.initialize_sheet()
+        return sheets_service
+
+    @cached_property
+    def gemini_service(self) -> Optional[GeminiService]:
+        """Serviço do Gemini (None se GEMINI_API_KEY não estiver configurada)"""
+        return GeminiService(config.GEMINI_API_KEY) if config.GEMINI_API_KEY else None
 
     def initialize_instagram(self):
         """Inicializa serviço do Instagram quando necessário"""
-        if not self.instagram_service and INSTAGRAM_USERNAME and INSTAGRAM_PASSWORD:
+        if not self.instagram_service and config.INSTAGRAM_USERNAME and config.INSTAGRAM_PASSWORD:
             try:
-                self.instagram_service = InstagramService(INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD)
+                self.instagram_service = InstagramService(config.INSTAGRAM_USERNAME, config.INSTAGRAM_PASSWORD)
                 return True
             except Exception as e:
                 logger.error(f"Erro ao inicializar Instagram: {e}")
                 return False
         return bool(self.instagram_service)
 
-    def scan_and_catalog(self, limit: Optional[int] = None) -> int:
+    def scan_and_catalog(self, limit: Optional[int] = None, force: bool = False) -> int:
         """
         Escaneia imagens do Drive e cataloga discos na planilha
         
         Args:
             limit: Número máximo de discos para processar
+            force: Reprocessa também discos cuja imagem frontal já está na planilha
             
         Returns:
             Número de discos catalogados
@@ -48,8 +88,17 @@ class CatalogService:
             logger.error("❌ Gemini API não configurada. Configure GEMINI_API_KEY no .env")
             return 0
 
-        # Busca pares de imagens
-        image_pairs = self.drive_service.download_all_images()
+        # Imagens frontais já catalogadas não voltam para o Gemini
+        cataloged_ids = set()
+        if not force:
+            cataloged_ids = {
+                match.group(1)
+                for vinyl in self._load_sheet_cached()
+                if (match := _DRIVE_FILE_RE.search(vinyl.get('imagem1', '')))
+            }
+
+        # Busca pares de imagens (miniaturas bastam para a análise)
+        image_pairs = self.drive_service.download_all_images(cataloged_ids, thumbnails=True)
 
         if not image_pairs:
             logger.warning("Nenhuma imagem encontrada para processar")
@@ -59,11 +108,50 @@ class CatalogService:
         if limit:
             image_pairs = image_pairs[:limit]
 
-        cataloged_count = 0
+        # Analisa os pares em paralelo (chamadas ao Gemini são I/O)
+        vinyls = asyncio.run(self._process_pairs(image_pairs))
+
+        # Grava na planilha em lote, na ordem dos pares
+        cataloged_count = self.sheets_service.bulk_upsert(
+            [vinyl for vinyl in vinyls if vinyl is not None]
+        )
+        if cataloged_count:
+            self._invalidate_cache()
 
-        for i, pair in enumerate(image_pairs, 1):
+        logger.info(f"\n🎉 Catalogação concluída! {cataloged_count} discos adicionados")
+        return cataloged_count
+
+    async def _process_pairs(self, image_pairs: List[dict]) -> List[Optional[Vinyl]]:
+        """Processa todos os pares de imagens com concorrência limitada"""
+        sem = asyncio.Semaphore(config.SCAN_CONCURRENCY)
+        total = len(image_pairs)
+        return await asyncio.gather(*[
+            self._process_pair(i, total, pair, sem)
+            for i, pair in enumerate(image_pairs, 1)
+        ])
+
+    async def _process_pair(
+        self,
+        index: int,
+        total: int,
+        pair: dict,
+        sem: asyncio.Semaphore
+    ) -> Optional[Vinyl]:
+        """
+        Analisa um par de imagens e gera o post de venda
+        
+        Args:
+            index: Posição do par (para log)
+            total: Total de pares
+            pair: Par de imagens (frente/verso)
+            sem: Semáforo que limita as chamadas simultâneas
+            
+        Returns:
+            Vinyl preenchido ou None em caso de erro
+        """
+        async with sem:
             try:
-                logger.info(f"\n📀 Processando disco {i}/{len(image_pairs)}")
+                logger.info(f"\n📀 Processando disco {index}/{total}")
 
                 front_info = pair['front']
                 back_info = pair['back']
@@ -72,28 +160,22 @@ class CatalogService:
                 back_path = back_info['path'] if back_info else None
 
                 # Analisa imagens com Gemini
-                vinyl = self.gemini_service.analyze_vinyl_images(front_path, back_path)
+                vinyl = await self.gemini_service.analyze_vinyl_images_async(
+                    front_path, back_path
+                )
 
                 # Adiciona URLs do Drive
                 vinyl.imagem1_url = self.drive_service.get_drive_url(front_info['id'])
                 vinyl.imagem2_url = self.drive_service.get_drive_url(back_info['id']) if back_info else None
 
                 # Gera post de venda
-                vinyl.post_venda = self.gemini_service.generate_sales_post(vinyl)
+                vinyl.post_venda = await self.gemini_service.generate_sales_post_async(vinyl)
 
-                # Adiciona à planilha (ou atualiza se já existir)
-                if self.sheets_service.add_or_update_vinyl(vinyl):
-                    cataloged_count += 1
-                    logger.info(f"✅ Disco catalogado: {vinyl.nome}")
-                else:
-                    logger.error(f"❌ Erro ao adicionar disco à planilha")
+                return vinyl
 
             except Exception as e:
-                logger.error(f"❌ Erro ao processar disco {i}: {e}")
-                continue
-
-        logger.info(f"\n🎉 Catalogação concluída! {cataloged_count} discos adicionados")
-        return cataloged_count
+                logger.error(f"❌ Erro ao processar disco {index}: {e}")
+                return None
 
     def publish_pending(self, limit: Optional[int] = None) -> int:
         """
@@ -112,8 +194,11 @@ class CatalogService:
             logger.error("❌ Instagram não configurado. Configure credenciais no .env")
             return 0
 
-        # Busca discos pendentes
-        pending_vinyls = self.sheets_service.get_pending_vinyls()
+        # Busca discos pendentes (reaproveita a leitura já feita da planilha)
+        pending_vinyls = [
+            v for v in self.list_catalog('pendente')
+            if v.get('Nome') and v.get('Post Venda')
+        ]
 
         if not pending_vinyls:
             logger.info("Nenhum disco pendente para publicação")
@@ -123,69 +208,157 @@ class CatalogService:
         if limit:
             pending_vinyls = pending_vinyls[:limit]
 
+        # Login só agora que há o que publicar
+        if not self.instagram_service.ensure_login():
+            logger.error("❌ Não foi possível fazer login no Instagram")
+            return 0
+
+        # As imagens são baixadas com pouca antecedência: os próximos discos
+        # baixam enquanto o atual é publicado, sem esperar o lote inteiro.
+        # A publicação continua sequencial para não disparar o rate limit do
+        # Instagram. O cliente do Drive é criado aqui, antes de abrir as
+        # threads, e repassado a elas.
+        drive_service = self.drive_service
         published_count = 0
+        remaining = iter(pending_vinyls)
+        downloads = deque()
 
-        for vinyl_data in pending_vinyls:
-            try:
-                logger.info(f"\n📸 Publicando: {vinyl_data['Nome']} - {vinyl_data['Artista']}")
-
-                # Prepara imagens baixando do Google Drive
-                images = []
-                
-                # Baixa imagem frontal
-                if vinyl_data.get("imagem1"):
-                    front_url = vinyl_data["imagem1"]
-                    front_file_id = self._extract_file_id_from_url(front_url)
-                    if front_file_id:
-                        try:
-                            # Gera nome único para o arquivo temporário
-                            front_filename = f"temp_front_{front_file_id}.jpg"
-                            front_path = self.drive_service.download_image(front_file_id, front_filename)
-                            images.append(front_path)
-                        except Exception as e:
-                            logger.error(f"Erro ao baixar imagem frontal: {e}")
-
-                # Baixa imagem traseira
-                if vinyl_data.get("imagem2"):
-                    back_url = vinyl_data["imagem2"]
-                    back_file_id = self._extract_file_id_from_url(back_url)
-                    if back_file_id:
-                        try:
-                            # Gera nome único para o arquivo temporário
-                            back_filename = f"temp_back_{back_file_id}.jpg"
-                            back_path = self.drive_service.download_image(back_file_id, back_filename)
-                            images.append(back_path)
-                        except Exception as e:
-                            logger.error(f"Erro ao baixar imagem traseira: {e}")
-
-                if not images:
-                    logger.error("Nenhuma imagem pôde ser baixada para o post")
-                    continue
-
-                # Publica no Instagram
-                caption = vinyl_data.get('Post Venda', '')
-                media = self.instagram_service.post_album(images, caption)
-
-                if media:
-                    # Atualiza status na planilha
-                    row_index = vinyl_data['row_index']
-                    self.sheets_service.update_status(
-                        row_index, 
-                        'publicado', 
-                        datetime.now()
+        with ThreadPoolExecutor(max_workers=config.PUBLISH_PREFETCH) as executor:
+
+            def schedule(count: int):
+                """Agenda o download dos próximos discos da fila"""
+                for vinyl_data in islice(remaining, count):
+                    downloads.append(
+                        (vinyl_data, executor.submit(self._prepare_images, vinyl_data, drive_service))
                     )
-                    published_count += 1
-                    logger.info(f"✅ Publicado com sucesso!")
-                else:
-                    logger.error(f"❌ Falha ao publicar no Instagram")
 
-            except Exception as e:
-                logger.error(f"❌ Erro ao publicar disco: {e}")
-                continue
+            try:
+                # Disco atual mais os antecipados
+                schedule(config.PUBLISH_PREFETCH + 1)
+
+                while downloads:
+                    vinyl_data, future = downloads[0]
+                    schedule(1)
+                    images = future.result()
+
+                    try:
+                        logger.info(f"\n📸 Publicando: {vinyl_data['Nome']} - {vinyl_data['Artista']}")
+
+                        if not images:
+                            logger.error("Nenhuma imagem pôde ser baixada para o post")
+                            continue
+
+                        # Publica no Instagram (o serviço respeita o intervalo entre posts)
+                        caption = vinyl_data.get('Post Venda', '')
+                        media = self.instagram_service.post_album(images, caption)
+
+                        if media:
+                            published_count += 1
+                            logger.info(f"✅ Publicado com sucesso!")
+                            # Grava o status logo após o post: se a execução for
+                            # interrompida, o disco não é publicado de novo na próxima
+                            if not self.sheets_service.update_status(
+                                vinyl_data['row_index'], 'publicado', datetime.now()
+                            ):
+                                logger.error(
+                                    f"❌ Falha ao gravar o status na linha {vinyl_data['row_index']}: "
+                                    "atualize para 'publicado' manualmente"
+                                )
+                        else:
+                            logger.error(f"❌ Falha ao publicar no Instagram")
+
+                    except Exception as e:
+                        logger.error(f"❌ Erro ao publicar disco: {e}")
+                        continue
+
+                    finally:
+                        # Remove os arquivos temporários do post
+                        for image in images:
+                            image.unlink(missing_ok=True)
+                        downloads.popleft()
+
+            finally:
+                # Interrompida a publicação, descarta também as imagens já
+                # baixadas dos discos que não chegaram a ser publicados
+                for _, future in downloads:
+                    if not future.cancel():
+                        for image in future.result():
+                            image.unlink(missing_ok=True)
+
+        if published_count:
+            self._invalidate_cache()
 
         logger.info(f"\n🎉 Publicação concluída! {published_count} posts publicados")
         return published_count
 
+    def _prepare_images(
+        self,
+        vinyl_data: dict,
+        drive_service: GoogleDriveService
+    ) -> List[Path]:
+        """
+        Baixa do Google Drive as imagens (frente e verso) de um disco
+        
+        Args:
+            vinyl_data: Linha da planilha com as URLs em imagem1/imagem2
+            drive_service: Serviço do Drive já criado (chamado em threads)
+            
+        Returns:
+            Caminhos locais das imagens que puderam ser baixadas
+        """
+        images = []
+
+        for column, prefix, label in (
+            ("imagem1", "temp_front", "frontal"),
+            ("imagem2", "temp_back", "traseira"),
+        ):
+            file_id = self._extract_file_id_from_url(vinyl_data.get(column))
+            if not file_id:
+                continue
+
+            try:
+                # O instagrapi só aceita caminhos: grava em arquivo temporário
+                # (em memória, via /dev/shm, quando disponível)
+                data = drive_service.download_image_to_buffer(file_id)
+                with tempfile.NamedTemporaryFile(
+                    prefix=f"{prefix}_{file_id}_",
+                    suffix=".jpg",
+                    dir=self._temp_images_dir(len(data)),
+                    delete=False
+                ) as tmp:
+                    tmp.write(data)
+                images.append(Path(tmp.name))
+            except Exception as e:
+                logger.error(f"Erro ao baixar imagem {label}: {e}")
+
+        return images
+
+    def _temp_images_dir(self, size: int) -> Optional[str]:
+        """
+        Escolhe o diretório do arquivo temporário de uma imagem
+        
+        Usa TEMP_IMAGES_DIR (/dev/shm) enquanto houver espaço livre para o
+        arquivo mais a folga de TEMP_IMAGES_MIN_FREE; caso contrário (o
+        /dev/shm do Docker tem 64 MB) volta ao diretório temporário padrão.
+        
+        Args:
+            size: Tamanho da imagem em bytes
+            
+        Returns:
+            Diretório a usar, ou None para o padrão do sistema
+        """
+        if not config.TEMP_IMAGES_DIR:
+            return None
+
+        try:
+            if shutil.disk_usage(config.TEMP_IMAGES_DIR).free >= size + config.TEMP_IMAGES_MIN_FREE:
+                return config.TEMP_IMAGES_DIR
+        except OSError:
+            pass
+
+        logger.debug(f"Pouco espaço em {config.TEMP_IMAGES_DIR}, usando o diretório temporário padrão")
+        return None
+
     def _extract_file_id_from_url(self, drive_url: str) -> Optional[str]:
         """
         Extrai o file_id de uma URL do Google Drive
@@ -196,14 +369,10 @@ class CatalogService:
         Returns:
             file_id ou None se não conseguir extrair
         """
-        import re
-        
         if not drive_url:
             return None
             
-        # Padrão para extrair file_id da URL do Drive
-        pattern = r'https://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)'
-        match = re.search(pattern, drive_url)
+        match = _DRIVE_FILE_RE.search(drive_url)
         
         if match:
             return match.group(1)
@@ -211,6 +380,43 @@ class CatalogService:
         logger.warning(f"Não foi possível extrair file_id da URL: {drive_url}")
         return None
 
+    def _load_sheet_cached(self) -> List[dict]:
+        """
+        Carrega todas as linhas da planilha uma única vez por comando
+        
+        Returns:
+            Lista de discos (reaproveitada nas chamadas seguintes)
+        """
+        if self._vinyls_cache is None:
+            vinyls = self.sheets_service.get_all_vinyls()
+            # Status normalizado (minúsculo) em lista própria, uma vez por leitura;
+            # as linhas mantêm o valor original da planilha
+            self._statuses_lc = [vinyl.get('Status', '').lower() for vinyl in vinyls]
+            self._vinyls_cache = vinyls
+        return self._vinyls_cache
+
+    def _status_index(self) -> Dict[str, List[dict]]:
+        """Agrupa os discos carregados por status (minúsculo), uma vez por leitura"""
+        if self._by_status is None:
+            vinyls = self._load_sheet_cached()
+            by_status: Dict[str, List[dict]] = {}
+            for vinyl, status in zip(vinyls, self._statuses_lc):
+                by_status.setdefault(status, []).append(vinyl)
+            self._by_status = by_status
+        return self._by_status
+
+    def statuses_lc(self) -> List[str]:
+        """Status (minúsculo) de todos os discos, na ordem da planilha"""
+        self._load_sheet_cached()
+        return self._statuses_lc
+
+    def _invalidate_cache(self):
+        """Descarta a leitura em cache após alterações na planilha"""
+        self._vinyls_cache = None
+        self._by_status = None
+        self._statuses_lc = []
+        self._status_queries = {}
+
     def list_catalog(self, status_filter: Optional[str] = None) -> List[dict]:
         """
         Lista discos catalogados com filtro opcional
@@ -221,20 +427,26 @@ class CatalogService:
         Returns:
             Lista de discos
         """
-        all_vinyls = self.sheets_service.get_all_vinyls()
-
         if status_filter:
-            filtered = [
-                v for v in all_vinyls 
-                if v.get('Status', '').lower() == status_filter.lower()
-            ]
-            return filtered
+            status_filter = status_filter.lower()
+
+            # Com a planilha já carregada, o filtro é só uma consulta ao índice
+            if self._vinyls_cache is not None:
+                return self._status_index().get(status_filter, [])
+
+            # Caso contrário busca no Sheets apenas as linhas desse status
+            if status_filter not in self._status_queries:
+                self._status_queries[status_filter] = self.sheets_service.query_by_status(status_filter)
+            return self._status_queries[status_filter]
 
-        return all_vinyls
+        return self._load_sheet_cached()
 
     def update_price(self, row_index: int, price: float) -> bool:
         """
-        Atualiza preço de um disco
+        Agenda a atualização de preço de um disco
+        
+        A escrita só acontece em flush(), que envia todos os preços
+        pendentes em uma única requisição.
         
         Args:
             row_index: Índice da linha na planilha
@@ -243,18 +455,31 @@ class CatalogService:
         Returns:
             True se sucesso
         """
-        try:
-            range_name = f"{self.sheets_service.sheet_name}!G{row_index}"
-            self.sheets_service.sheets_service.spreadsheets().values().update(
-                spreadsheetId=self.sheets_service.spreadsheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body={'values': [[f'R$ {price:.2f}']]}
-            ).execute()
+        self._pending_prices[row_index] = price
+        return True
 
-            logger.info(f"✅ Preço atualizado na linha {row_index}")
+    def flush(self) -> bool:
+        """
+        Envia para a planilha as atualizações de preço pendentes
+        
+        Returns:
+            True se sucesso
+        """
+        if not self._pending_prices:
             return True
 
-        except Exception as e:
-            logger.error(f"❌ Erro ao atualizar preço: {e}")
+        updates = {
+            f"{self.sheets_service.sheet_name}!G{row_index}": [[f'R$ {price:.2f}']]
+            for row_index, price in self._pending_prices.items()
+        }
+
+        if not self.sheets_service.batch_update_values(updates):
+            logger.error("❌ Erro ao atualizar preço")
             return False
+
+        for row_index in self._pending_prices:
+            logger.info(f"✅ Preço atualizado na linha {row_index}")
+
+        self._pending_prices.clear()
+        self._invalidate_cache()
+        return True
@@ -1,10 +1,72 @@
+import asyncio
 import google.generativeai as genai
+import hashlib
+import io
+import json
+import re
+import shelve
+import sqlite3
+import threading
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple, TypedDict
 from PIL import Image
 from src.models.vinyl import Vinyl
+from src.utils import config
 from src.utils.logger import logger
 
+class _VinylExtract(TypedDict):
+    """Formato da resposta da análise (repassado ao Gemini como schema JSON)"""
+    nome: str
+    artista: str
+    ano: Optional[str]
+    musicas: List[str]
+    gravadora: Optional[str]
+    condicao: str
+    detalhes: str
+
+
+# Força a resposta da análise em JSON no formato de _VinylExtract
+_ANALYSIS_CONFIG = genai.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=_VinylExtract
+)
+
+# Prompt detalhado para análise
+_ANALYSIS_PROMPT = """
+            Analise as imagens de capa (e contracapa se disponível) deste disco de vinil.
+            
+            Extraia as seguintes informações:
+            1. Nome do álbum/disco
+            2. Nome do artista/banda
+            3. Ano de lançamento (se visível)
+            4. Lista de músicas (se visível na contracapa)
+            5. Gravadora/selo (se visível)
+            6. Condição aparente do disco e capa (baseado nas fotos)
+            
+            Seja preciso e extraia apenas informações visíveis nas imagens.
+"""
+# Introduções que o Gemini às vezes coloca antes do post
+_INTRO_PATTERNS = (
+    "Aqui está uma sugestão de post para o Instagram:",
+    "Aqui está o post para o Instagram:",
+    "Aqui está uma proposta de post para o Instagram:",
+    "Sugestão de post:",
+    "Post para Instagram:",
+)
+# Remove, em uma única passada, as introduções no início de linha e as
+# linhas contendo apenas "---"
+_INTRO_RE = re.compile(
+    r'^(?:' + '|'.join(map(re.escape, _INTRO_PATTERNS)) + r')\s*'
+    r'|^[ \t]*---[ \t]*(?:\n|$)',
+    re.MULTILINE
+)
+
+# Qualidade JPEG das imagens recomprimidas para análise
+_ANALYSIS_IMAGE_QUALITY = 85
+
+# Faz parte da chave do cache de análises: altere ao mudar o prompt
+_ANALYSIS_PROMPT_VERSION = b"2"
+
 
 class GeminiService:
     """Serviço para análise de imagens usando Gemini AI"""
@@ -12,6 +74,133 @@ class GeminiService:
     def __init__(self, api_key: str):
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
+        # shelve não suporta acesso concorrente entre threads
+        self._post_cache_lock = threading.Lock()
+        
+        # Cache de análises, indexado pelo conteúdo das imagens
+        self._analysis_cache_lock = threading.Lock()
+        self._analysis_cache = sqlite3.connect(str(config.ANALYSIS_CACHE_FILE), check_same_thread=False)
+        self._analysis_cache.execute(
+            "CREATE TABLE IF NOT EXISTS cache (k BLOB PRIMARY KEY, v TEXT)"
+        )
+    
+    def _read_images(
+        self,
+        front_image_path: Path,
+        back_image_path: Optional[Path] = None
+    ) -> List[bytes]:
+        """
+        Lê uma única vez os bytes da capa e da contracapa (se existir); os
+        mesmos bytes servem para a chave do cache e para o envio ao Gemini
+        """
+        raw_images = [front_image_path.read_bytes()]
+        
+        if back_image_path and back_image_path.exists():
+            raw_images.append(back_image_path.read_bytes())
+        
+        return raw_images
+    
+    def _load_image(self, raw_image: bytes) -> Dict:
+        """
+        Prepara uma imagem para envio ao Gemini, reduzida para no máximo
+        ANALYSIS_IMAGE_MAX_SIDE pixels e recomprimida em JPEG
+        """
+        with Image.open(io.BytesIO(raw_image)) as img:
+            max_side = config.ANALYSIS_IMAGE_MAX_SIDE
+            
+            # Já está pequena e em JPEG: envia os bytes como estão
+            if img.format == 'JPEG' and max(img.size) <= max_side:
+                return {'mime_type': 'image/jpeg', 'data': raw_image}
+            
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.convert('RGB').save(
+                buffer, 'JPEG', quality=_ANALYSIS_IMAGE_QUALITY, optimize=True
+            )
+        
+        return {'mime_type': 'image/jpeg', 'data': buffer.getvalue()}
+    
+    def _load_images(self, raw_images: List[bytes]) -> List[Dict]:
+        """Prepara para envio ao Gemini todas as imagens de um disco"""
+        return [self._load_image(raw_image) for raw_image in raw_images]
+    
+    def _lookup_analysis(
+        self,
+        front_image_path: Path,
+        back_image_path: Optional[Path] = None
+    ) -> Tuple[List[bytes], bytes, Optional[Dict]]:
+        """
+        Lê as imagens e consulta o cache de análises
+        
+        Returns:
+            Bytes das imagens, chave do cache e análise em cache (ou None)
+        """
+        raw_images = self._read_images(front_image_path, back_image_path)
+        cache_key = self._analysis_cache_key(raw_images)
+        return raw_images, cache_key, self._get_cached_analysis(cache_key)
+    
+    def _analysis_cache_key(self, raw_images: List[bytes]) -> bytes:
+        """Chave do cache de análises: hash do conteúdo das imagens e do prompt"""
+        digest = hashlib.sha256()
+        
+        for raw_image in raw_images:
+            digest.update(raw_image)
+        
+        digest.update(_ANALYSIS_PROMPT_VERSION)
+        return digest.digest()
+    
+    def _get_cached_analysis(self, cache_key: bytes) -> Optional[Dict]:
+        """Busca uma análise já feita para as mesmas imagens"""
+        with self._analysis_cache_lock:
+            row = self._analysis_cache.execute(
+                "SELECT v FROM cache WHERE k = ?", (cache_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def _store_cached_analysis(self, cache_key: bytes, data: Dict):
+        """Guarda o resultado de uma análise no cache"""
+        with self._analysis_cache_lock, self._analysis_cache:
+            self._analysis_cache.execute(
+                "INSERT OR REPLACE INTO cache (k, v) VALUES (?, ?)",
+                (cache_key, json.dumps(data))
+            )
+    
+    def _build_vinyl(
+        self,
+        data: Dict,
+        front_image_path: Path,
+        back_image_path: Optional[Path] = None
+    ) -> Vinyl:
+        """Converte os dados da análise em um Vinyl"""
+        # Cria objeto Vinyl
+        vinyl = Vinyl(
+            nome=data.get('nome', 'Desconhecido'),
+            artista=data.get('artista', 'Desconhecido'),
+            ano=data.get('ano'),
+            condicao=data.get('condicao', 'A verificar'),
+            descricao=self._format_description(data),
+            imagem_frente=str(front_image_path),
+            imagem_verso=str(back_image_path) if back_image_path else None
+        )
+        
+        logger.info(f"✅ Análise concluída: {vinyl.nome} - {vinyl.artista}")
+        return vinyl
+    
+    def _analysis_error(
+        self,
+        error: Exception,
+        front_image_path: Path,
+        back_image_path: Optional[Path] = None
+    ) -> Vinyl:
+        """Retorna vinyl com informações básicas em caso de erro"""
+        logger.error(f"Erro ao analisar imagens: {error}")
+        return Vinyl(
+            nome="[Erro na análise]",
+            artista="[Verificar manualmente]",
+            descricao=f"Erro ao analisar: {str(error)}",
+            imagem_frente=str(front_image_path),
+            imagem_verso=str(back_image_path) if back_image_path else None
+        )
     
     def analyze_vinyl_images(
         self, 
@@ -20,182 +209,203 @@ class GeminiService:
     ) -> Vinyl:
         """
         Analisa imagens de capa e contracapa para extrair informações do disco
+        
+        O resultado fica em cache, indexado pelo conteúdo das imagens: uma
+        nova execução sobre as mesmas fotos não chama o Gemini novamente.
         """
         try:
-            # Carrega imagens
-            images = []
-            front_img = Image.open(front_image_path)
-            images.append(front_img)
-            
-            if back_image_path and back_image_path.exists():
-                back_img = Image.open(back_image_path)
-                images.append(back_img)
-            
-            # Prompt detalhado para análise
-            prompt = """
-            Analise as imagens de capa (e contracapa se disponível) deste disco de vinil.
-            
-            Extraia as seguintes informações:
-            1. Nome do álbum/disco
-            2. Nome do artista/banda
-            3. Ano de lançamento (se visível)
-            4. Lista de músicas (se visível na contracapa)
-            5. Gravadora/selo (se visível)
-            6. Condição aparente do disco e capa (baseado nas fotos)
-            
-            Retorne as informações no seguinte formato JSON:
-            {
-                "nome": "nome do álbum",
-                "artista": "nome do artista",
-                "ano": "ano ou null",
-                "musicas": ["lista", "de", "músicas"],
-                "gravadora": "nome da gravadora ou null",
-                "condicao": "descrição da condição",
-                "detalhes": "outros detalhes relevantes"
-            }
-            
-            Seja preciso e extraia apenas informações visíveis nas imagens.
-            """
-            
-            # Gera resposta
-            response = self.model.generate_content([prompt] + images)
+            raw_images, cache_key, data = self._lookup_analysis(
+                front_image_path, back_image_path
+            )
             
-            # Parse do JSON da resposta
-            import json
-            # Extrai JSON da resposta (pode estar entre ```json e ```)
-            text = response.text
-            if '```json' in text:
-                json_start = text.find('```json') + 7
-                json_end = text.find('```', json_start)
-                json_text = text[json_start:json_end].strip()
+            if data is None:
+                images = self._load_images(raw_images)
+                response = self.model.generate_content(
+                    [_ANALYSIS_PROMPT] + images,
+                    generation_config=_ANALYSIS_CONFIG
+                )
+                data = json.loads(response.text)
+                self._store_cached_analysis(cache_key, data)
             else:
-                json_text = text.strip()
+                logger.info("✅ Análise reaproveitada do cache")
             
-            data = json.loads(json_text)
+            return self._build_vinyl(data, front_image_path, back_image_path)
             
-            # Cria objeto Vinyl
-            vinyl = Vinyl(
-                nome=data.get('nome', 'Desconhecido'),
-                artista=data.get('artista', 'Desconhecido'),
-                ano=data.get('ano'),
-                condicao=data.get('condicao', 'A verificar'),
-                descricao=self._format_description(data),
-                imagem_frente=str(front_image_path),
-                imagem_verso=str(back_image_path) if back_image_path else None
+        except Exception as e:
+            return self._analysis_error(e, front_image_path, back_image_path)
+    
+    async def analyze_vinyl_images_async(
+        self,
+        front_image_path: Path,
+        back_image_path: Optional[Path] = None
+    ) -> Vinyl:
+        """
+        Versão assíncrona de analyze_vinyl_images (várias análises podem
+        aguardar a resposta do Gemini ao mesmo tempo)
+        
+        Leitura dos arquivos, redimensionamento e cache rodam em threads,
+        para não travar o event loop enquanto outras análises aguardam.
+        """
+        try:
+            raw_images, cache_key, data = await asyncio.to_thread(
+                self._lookup_analysis, front_image_path, back_image_path
             )
             
-            logger.info(f"✅ Análise concluída: {vinyl.nome} - {vinyl.artista}")
-            return vinyl
+            if data is None:
+                images = await asyncio.to_thread(self._load_images, raw_images)
+                response = await self.model.generate_content_async(
+                    [_ANALYSIS_PROMPT] + images,
+                    generation_config=_ANALYSIS_CONFIG
+                )
+                data = json.loads(response.text)
+                await asyncio.to_thread(self._store_cached_analysis, cache_key, data)
+            else:
+                logger.info("✅ Análise reaproveitada do cache")
+            
+            return self._build_vinyl(data, front_image_path, back_image_path)
             
         except Exception as e:
-            logger.error(f"Erro ao analisar imagens: {e}")
-            # Retorna vinyl com informações básicas em caso de erro
-            return Vinyl(
-                nome="[Erro na análise]",
-                artista="[Verificar manualmente]",
-                descricao=f"Erro ao analisar: {str(e)}",
-                imagem_frente=str(front_image_path),
-                imagem_verso=str(back_image_path) if back_image_path else None
-            )
+            return self._analysis_error(e, front_image_path, back_image_path)
     
     def _format_description(self, data: Dict) -> str:
         """Formata descrição detalhada do disco"""
-        parts = []
+        gravadora = data.get('gravadora')
+        musicas = "\n".join(map("• {}".format, (data.get('musicas') or [])[:10]))  # Limita a 10
+        detalhes = data.get('detalhes')
+        
+        # Seções vazias são descartadas
+        return "\n\n".join(filter(None, (
+            gravadora and f"Gravadora: {gravadora}",
+            musicas and f"Principais faixas:\n{musicas}",
+            detalhes and f"Observações: {detalhes}",
+        )))
+    
+    def _sales_post_cache_key(self, vinyl: Vinyl) -> str:
+        """Chave do cache de posts: hash dos dados usados no prompt"""
+        identity = (
+            vinyl.nome, vinyl.artista, vinyl.ano,
+            vinyl.condicao, vinyl.descricao, vinyl.preco
+        )
+        return hashlib.sha256(json.dumps(identity).encode('utf-8')).hexdigest()
+    
+    def _sales_post_prompt(self, vinyl: Vinyl) -> str:
+        """Monta o prompt de geração do post de venda"""
+        return f"""
+        Crie um post atrativo para venda deste disco de vinil no Instagram.
+        
+        Informações do disco:
+        - Nome: {vinyl.nome}
+        - Artista: {vinyl.artista}
+        - Ano: {vinyl.ano or 'não informado'}
+        - Condição: {vinyl.condicao}
+        - Descrição: {vinyl.descricao or 'sem descrição adicional'}
+        - Preço: {f'R$ {vinyl.preco:.2f}' if vinyl.preco else 'a definir'}
+        
+        O post deve:
+        1. Ser conciso e atrativo (máximo 300 caracteres principais)
+        2. Destacar pontos positivos do disco
+        3. INCLUIR AS PRINCIPAIS MÚSICAS/FAIXAS do disco na descrição
+        4. Incluir emojis relevantes
+        5. Ter call-to-action (chamar no direct, etc)
+        6. Incluir hashtags relevantes no final
+        
+        IMPORTANTE: Retorne APENAS o post final, sem introduções como "Aqui está..." ou explicações.
         
-        if data.get('gravadora'):
-            parts.append(f"Gravadora: {data['gravadora']}")
+        Formato desejado:
+        [Texto principal atrativo]
         
-        if data.get('musicas'):
-            musicas = "\n".join(f"• {m}" for m in data['musicas'][:10])  # Limita a 10
-            parts.append(f"Principais faixas:\n{musicas}")
+        🎵 Principais faixas:
+        [Lista das principais músicas do disco]
         
-        if data.get('detalhes'):
-            parts.append(f"Observações: {data['detalhes']}")
+        💿 Detalhes:
+        [Informações importantes sobre condição, gravadora, etc]
         
-        return "\n\n".join(parts) if parts else ""
+        📩 Interessado? Chama no direct!
+        
+        [Hashtags relevantes]
+        """
+    
+    def _clean_sales_post(self, text: str) -> str:
+        """Remove introduções e separadores indesejados do post gerado"""
+        # Remove introduções indesejadas e separadores
+        post = _INTRO_RE.sub('', text.strip()).strip()
+        
+        # Limita tamanho se necessário
+        if len(post) > 2000:  # Limite do Instagram
+            post = post[:1997] + "..."
+        
+        return post
+    
+    def _fallback_sales_post(self, vinyl: Vinyl) -> str:
+        """Post genérico em caso de erro"""
+        return f"""
+🎵 {vinyl.nome} - {vinyl.artista} 🎵
+
+💿 Disco em {vinyl.condicao or 'ótima condição'}
+{'📅 Ano: ' + vinyl.ano if vinyl.ano else ''}
+{'💰 R$ ' + f'{vinyl.preco:.2f}' if vinyl.preco else '💰 Preço especial'}
+
+📩 Interessado? Chama no direct!
+
+#vinil #discosdevinil #vinilbrasil #colecionadores #música
+        """.strip()
+    
+    def _get_cached_post(self, cache_key: str) -> Optional[str]:
+        """Busca um post já gerado no cache em disco"""
+        with self._post_cache_lock, shelve.open(str(config.SALES_POST_CACHE_FILE)) as cache:
+            return cache.get(cache_key)
+    
+    def _store_cached_post(self, cache_key: str, post: str):
+        """Guarda um post gerado no cache em disco"""
+        with self._post_cache_lock, shelve.open(str(config.SALES_POST_CACHE_FILE)) as cache:
+            cache[cache_key] = post
     
     def generate_sales_post(self, vinyl: Vinyl) -> str:
         """
         Gera post para venda no Instagram baseado nas informações do disco
+        
+        Posts gerados ficam em cache em disco: um novo scan do mesmo disco,
+        com os mesmos dados, não chama o Gemini novamente.
         """
+        cache_key = self._sales_post_cache_key(vinyl)
+        cached_post = self._get_cached_post(cache_key)
+        
+        if cached_post:
+            logger.info("✅ Post de venda reaproveitado do cache")
+            return cached_post
+        
         try:
-            prompt = f"""
-            Crie um post atrativo para venda deste disco de vinil no Instagram.
-            
-            Informações do disco:
-            - Nome: {vinyl.nome}
-            - Artista: {vinyl.artista}
-            - Ano: {vinyl.ano or 'não informado'}
-            - Condição: {vinyl.condicao}
-            - Descrição: {vinyl.descricao or 'sem descrição adicional'}
-            - Preço: {f'R$ {vinyl.preco:.2f}' if vinyl.preco else 'a definir'}
-            
-            O post deve:
-            1. Ser conciso e atrativo (máximo 300 caracteres principais)
-            2. Destacar pontos positivos do disco
-            3. INCLUIR AS PRINCIPAIS MÚSICAS/FAIXAS do disco na descrição
-            4. Incluir emojis relevantes
-            5. Ter call-to-action (chamar no direct, etc)
-            6. Incluir hashtags relevantes no final
-            
-            IMPORTANTE: Retorne APENAS o post final, sem introduções como "Aqui está..." ou explicações.
-            
-            Formato desejado:
-            [Texto principal atrativo]
-            
-            🎵 Principais faixas:
-            [Lista das principais músicas do disco]
+            # Recebe o post em partes e junta uma única vez no final
+            response = self.model.generate_content(self._sales_post_prompt(vinyl), stream=True)
+            post = self._clean_sales_post("".join([chunk.text for chunk in response]))
+            self._store_cached_post(cache_key, post)
             
-            💿 Detalhes:
-            [Informações importantes sobre condição, gravadora, etc]
-            
-            📩 Interessado? Chama no direct!
-            
-            [Hashtags relevantes]
-            """
-            
-            response = self.model.generate_content(prompt)
-            post = response.text.strip()
-            
-            # Remove introduções indesejadas
-            intro_patterns = [
-                "Aqui está uma sugestão de post para o Instagram:",
-                "Aqui está o post para o Instagram:",
-                "Aqui está uma proposta de post para o Instagram:",
-                "Sugestão de post:",
-                "Post para Instagram:",
-                "---"
-            ]
-            
-            for pattern in intro_patterns:
-                if post.startswith(pattern):
-                    post = post[len(pattern):].strip()
-                # Remove também se estiver no meio do texto seguido de quebra de linha
-                post = post.replace(f"{pattern}\n", "").replace(f"{pattern}\n\n", "")
-            
-            # Remove linhas com apenas "---" 
-            lines = post.split('\n')
-            lines = [line for line in lines if line.strip() != "---"]
-            post = '\n'.join(lines)
+            logger.info("✅ Post de venda gerado")
+            return post
             
-            # Limita tamanho se necessário
-            if len(post) > 2000:  # Limite do Instagram
-                post = post[:1997] + "..."
+        except Exception as e:
+            logger.error(f"Erro ao gerar post: {e}")
+            return self._fallback_sales_post(vinyl)
+    
+    async def generate_sales_post_async(self, vinyl: Vinyl) -> str:
+        """Versão assíncrona de generate_sales_post (cache em disco acessado em thread)"""
+        cache_key = self._sales_post_cache_key(vinyl)
+        cached_post = await asyncio.to_thread(self._get_cached_post, cache_key)
+        
+        if cached_post:
+            logger.info("✅ Post de venda reaproveitado do cache")
+            return cached_post
+        
+        try:
+            response = await self.model.generate_content_async(
+                self._sales_post_prompt(vinyl), stream=True
+            )
+            post = self._clean_sales_post("".join([chunk.text async for chunk in response]))
+            await asyncio.to_thread(self._store_cached_post, cache_key, post)
             
             logger.info("✅ Post de venda gerado")
             return post
             
         except Exception as e:
             logger.error(f"Erro ao gerar post: {e}")
-            # Post genérico em caso de erro
-            return f"""
-🎵 {vinyl.nome} - {vinyl.artista} 🎵
-
-💿 Disco em {vinyl.condicao or 'ótima condição'}
-{'📅 Ano: ' + vinyl.ano if vinyl.ano else ''}
-{'💰 R$ ' + f'{vinyl.preco:.2f}' if vinyl.preco else '💰 Preço especial'}
-
-📩 Interessado? Chama no direct!
-
-#vinil #discosdevinil #vinilbrasil #colecionadores #música
-            """.strip()
\ No newline at end of file
+            return self._fallback_sales_post(vinyl)
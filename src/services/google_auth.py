@@ -2,7 +2,7 @@ from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from src.utils.config import GOOGLE_CREDENTIALS_FILE, GOOGLE_TOKEN_FILE, GOOGLE_SHEETS_ID
+from src.utils import config
 from src.utils.logger import logger
 
 
@@ -15,16 +15,26 @@ class GoogleAuthService:
         'https://www.googleapis.com/auth/spreadsheets'
     ]
     
+    # Instância compartilhada pelos serviços do Drive e do Sheets
+    _instance = None
+    
     def __init__(self):
         self.creds = None
         self._authenticate()
     
+    @classmethod
+    def get_instance(cls) -> 'GoogleAuthService':
+        """Retorna a instância compartilhada, autenticando apenas na primeira chamada"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+    
     def _authenticate(self):
         """Realiza autenticação com Google OAuth2"""
         # Token existe e é válido
-        if GOOGLE_TOKEN_FILE.exists():
+        if config.GOOGLE_TOKEN_FILE.exists():
             self.creds = Credentials.from_authorized_user_file(
-                str(GOOGLE_TOKEN_FILE), 
+                str(config.GOOGLE_TOKEN_FILE), 
                 self.SCOPES
             )
             logger.debug("Token carregado do arquivo")
@@ -35,32 +45,32 @@ class GoogleAuthService:
                 logger.info("Renovando token expirado...")
                 self.creds.refresh(Request())
             else:
-                if not GOOGLE_CREDENTIALS_FILE.exists():
+                if not config.GOOGLE_CREDENTIALS_FILE.exists():
                     raise FileNotFoundError(
-                        f"Arquivo de credenciais não encontrado: {GOOGLE_CREDENTIALS_FILE}\n"
+                        f"Arquivo de credenciais não encontrado: {config.GOOGLE_CREDENTIALS_FILE}\n"
                         "Por favor, baixe as credenciais do Google Cloud Console e "
-                        f"salve em {GOOGLE_CREDENTIALS_FILE}"
+                        f"salve em {config.GOOGLE_CREDENTIALS_FILE}"
                     )
                 
                 logger.info("Iniciando fluxo de autenticação OAuth2...")
                 flow = InstalledAppFlow.from_client_secrets_file(
-                    str(GOOGLE_CREDENTIALS_FILE), 
+                    str(config.GOOGLE_CREDENTIALS_FILE), 
                     self.SCOPES
                 )
                 self.creds = flow.run_local_server(port=0)
             
-            # Salva as credenciais para próxima execução
-            with open(GOOGLE_TOKEN_FILE, 'w') as token:
+            # Salva as credenciais (incluindo a expiração) para próxima execução
+            with open(config.GOOGLE_TOKEN_FILE, 'w') as token:
                 token.write(self.creds.to_json())
             logger.info("Token salvo com sucesso")
     
     def get_drive_service(self):
         """Retorna serviço autenticado do Google Drive"""
-        return build('drive', 'v3', credentials=self.creds)
+        return build('drive', 'v3', credentials=self.creds, cache_discovery=False)
     
     def get_sheets_service(self):
         """Retorna serviço autenticado do Google Sheets"""
-        return build('sheets', 'v4', credentials=self.creds)
+        return build('sheets', 'v4', credentials=self.creds, cache_discovery=False)
     
     def test_connection(self):
         """Testa a conexão com as APIs do Google"""
@@ -73,7 +83,7 @@ class GoogleAuthService:
             # Testa Sheets
             sheets_service = self.get_sheets_service()
             sheets_service.spreadsheets().get(
-                spreadsheetId=GOOGLE_SHEETS_ID
+                spreadsheetId=config.GOOGLE_SHEETS_ID
             ).execute()
             logger.info("✅ Conexão com Google Sheets estabelecida")
             
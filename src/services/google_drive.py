@@ -1,23 +1,52 @@
 import io
 import os
+import re
+import threading
+from itertools import zip_longest
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Set, Tuple, Optional
+from google.auth.transport.requests import AuthorizedSession
 from googleapiclient.http import MediaIoBaseDownload
 from src.services.google_auth import GoogleAuthService
-from src.utils.config import GOOGLE_DRIVE_FOLDER_ID, DOWNLOADS_DIR, IMAGE_EXTENSIONS
+from src.utils import config
 from src.utils.logger import logger
 
+# Sufixo de tamanho do thumbnailLink (ex.: "...=s220")
+_THUMBNAIL_SIZE_RE = re.compile(r'=s\d+$')
+
 
 class GoogleDriveService:
     """Serviço para interagir com Google Drive"""
     
-    def __init__(self):
-        self.auth_service = GoogleAuthService()
+    def __init__(self, auth_service: Optional[GoogleAuthService] = None):
+        # Por padrão reaproveita a autenticação já feita no processo
+        self.auth_service = auth_service or GoogleAuthService.get_instance()
         self.drive_service = self.auth_service.get_drive_service()
+        self._local = threading.local()
+    
+    def _get_thread_service(self):
+        """Retorna um cliente do Drive exclusivo da thread atual (httplib2 não é thread-safe)"""
+        if threading.current_thread() is threading.main_thread():
+            return self.drive_service
+        
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self.auth_service.get_drive_service()
+            self._local.service = service
+        return service
+    
+    def _get_thread_session(self) -> AuthorizedSession:
+        """Retorna uma sessão HTTP autenticada exclusiva da thread atual"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = AuthorizedSession(self.auth_service.creds)
+            self._local.session = session
+        return session
     
     def list_images(self, folder_id: str | None = None) -> List[Dict]:
         """Lista todas as imagens na pasta do Drive"""
-        folder_id = folder_id or GOOGLE_DRIVE_FOLDER_ID
+        folder_id = folder_id or config.GOOGLE_DRIVE_FOLDER_ID
         
         try:
             # Query para buscar apenas imagens
@@ -36,7 +65,7 @@ class GoogleDriveService:
                 response = self.drive_service.files().list(
                     q=query,
                     spaces='drive',
-                    fields='nextPageToken, files(id, name, mimeType, modifiedTime)',
+                    fields='nextPageToken, files(id, name, mimeType, modifiedTime, thumbnailLink, size)',
                     pageToken=page_token,
                     orderBy='modifiedTime desc'
                 ).execute()
@@ -58,40 +87,104 @@ class GoogleDriveService:
         """Baixa uma imagem do Drive para o diretório local"""
         try:
             # Define caminho de destino
-            file_path = DOWNLOADS_DIR / file_name
+            file_path = config.DOWNLOADS_DIR / file_name
             
             # Se arquivo já existe, não baixa novamente
             if file_path.exists():
                 logger.debug(f"Arquivo já existe: {file_name}")
                 return file_path
             
-            # Faz o download
-            request = self.drive_service.files().get_media(fileId=file_id)
+            # Faz o download gravando direto no arquivo de destino
+            request = self._get_thread_service().files().get_media(fileId=file_id)
+            try:
+                with open(file_path, 'wb') as fh:
+                    downloader = MediaIoBaseDownload(fh, request)
+                    
+                    done = False
+                    while done is False:
+                        _, done = downloader.next_chunk()
+            except Exception:
+                # Não deixa arquivo incompleto (seria tratado como já baixado)
+                file_path.unlink(missing_ok=True)
+                raise
+            
+            logger.info(f"✅ Download concluído: {file_name}")
+            return file_path
+            
+        except Exception as e:
+            logger.error(f"Erro ao baixar arquivo {file_name}: {e}")
+            raise
+    
+    def download_thumbnail(self, image: Dict, max_side: Optional[int] = None) -> Path:
+        """
+        Baixa a miniatura da imagem (maior lado até max_side pixels, por
+        padrão ANALYSIS_IMAGE_MAX_SIDE) usando o thumbnailLink da listagem,
+        em vez do arquivo original
+        
+        Sem miniatura disponível ou em caso de falha, baixa o arquivo
+        original com download_image.
+        """
+        max_side = max_side or config.ANALYSIS_IMAGE_MAX_SIDE
+        
+        # Arquivo original já baixado: não há o que economizar
+        original_path = config.DOWNLOADS_DIR / image['name']
+        if original_path.exists():
+            return original_path
+        
+        thumbnail_link = image.get('thumbnailLink')
+        if not thumbnail_link:
+            return self.download_image(image['id'], image['name'])
+        
+        file_path = config.DOWNLOADS_DIR / f"{Path(image['name']).stem}_s{max_side}.jpg"
+        if file_path.exists():
+            logger.debug(f"Miniatura já existe: {file_path.name}")
+            return file_path
+        
+        try:
+            url = _THUMBNAIL_SIZE_RE.sub(f"=s{max_side}", thumbnail_link)
+            response = self._get_thread_session().get(url, timeout=30)
+            response.raise_for_status()
+            file_path.write_bytes(response.content)
+            
+            logger.info(f"✅ Miniatura baixada: {image['name']}")
+            return file_path
+            
+        except Exception as e:
+            logger.warning(f"Miniatura indisponível para {image['name']}, baixando original: {e}")
+            return self.download_image(image['id'], image['name'])
+    
+    def download_image_to_buffer(self, file_id: str) -> bytes:
+        """Baixa uma imagem do Drive direto para memória, sem gravar em disco"""
+        try:
+            request = self._get_thread_service().files().get_media(fileId=file_id)
             fh = io.BytesIO()
             downloader = MediaIoBaseDownload(fh, request)
             
             done = False
             while done is False:
-                status, done = downloader.next_chunk()
-                if status:
-                    logger.debug(f"Download {int(status.progress() * 100)}% completo")
+                _, done = downloader.next_chunk()
             
-            # Salva o arquivo
-            fh.seek(0)
-            with open(file_path, 'wb') as f:
-                f.write(fh.read())
-            
-            logger.info(f"✅ Download concluído: {file_name}")
-            return file_path
+            logger.debug(f"Download em memória concluído: {file_id}")
+            return fh.getvalue()
             
         except Exception as e:
-            logger.error(f"Erro ao baixar arquivo {file_name}: {e}")
+            logger.error(f"Erro ao baixar arquivo {file_id}: {e}")
             raise
     
-    def download_all_images(self) -> List[Dict]:
+    def download_all_images(
+        self,
+        skip_front_ids: Optional[Set[str]] = None,
+        thumbnails: bool = False
+    ) -> List[Dict]:
         """
         Baixa todas as imagens da pasta e agrupa em pares (frente/verso)
         Retorna lista de dicionários com informações completas
+        
+        Args:
+            skip_front_ids: IDs de imagens frontais já catalogadas; esses
+                pares são descartados antes do download
+            thumbnails: Baixa miniaturas (suficientes para a análise) em vez
+                dos arquivos originais
         """
         images = self.list_images()
         
@@ -99,37 +192,69 @@ class GoogleDriveService:
             logger.warning("Nenhuma imagem encontrada no Drive")
             return []
         
-        # Baixa todas as imagens
-        downloaded_files = []
-        for img in images:
-            try:
-                file_path = self.download_image(img['id'], img['name'])
-                downloaded_files.append({
-                    'path': file_path,
-                    'name': img['name'],
-                    'id': img['id'],
-                    'modified': img['modifiedTime']
-                })
-            except Exception as e:
-                logger.error(f"Erro ao baixar {img['name']}: {e}")
-                continue
+        # Agrupa em pares (assumindo ordem por data de modificação);
+        # uma imagem final sem par fica com verso None
+        it = iter(images)
+        image_pairs = list(zip_longest(it, it))
+        
+        # Descarta pares já catalogados antes de baixar qualquer arquivo
+        if skip_front_ids:
+            total = len(image_pairs)
+            image_pairs = [
+                pair for pair in image_pairs
+                if pair[0]['id'] not in skip_front_ids
+            ]
+            if total > len(image_pairs):
+                logger.info(f"{total - len(image_pairs)} discos já catalogados foram ignorados")
+        
+        # Baixa as imagens dos pares restantes em paralelo
+        downloaded_files = {}
+        with ThreadPoolExecutor(max_workers=config.DOWNLOAD_WORKERS) as executor:
+            if thumbnails:
+                futures = {
+                    executor.submit(self.download_thumbnail, img): img
+                    for pair in image_pairs for img in pair if img
+                }
+            else:
+                futures = {
+                    executor.submit(self.download_image, img['id'], img['name']): img
+                    for pair in image_pairs for img in pair if img
+                }
+            for future in as_completed(futures):
+                img = futures[future]
+                try:
+                    downloaded_files[img['id']] = {
+                        'path': future.result(),
+                        'name': img['name'],
+                        'id': img['id'],
+                        'modified': img['modifiedTime']
+                    }
+                except Exception as e:
+                    logger.error(f"Erro ao baixar {img['name']}: {e}")
         
-        # Agrupa em pares (assumindo ordem por data de modificação)
         pairs = []
-        for i in range(0, len(downloaded_files), 2):
-            if i + 1 < len(downloaded_files):
+        for front_img, back_img in image_pairs:
+            front = downloaded_files.get(front_img['id'])
+            if not front:
+                continue
+            
+            if back_img:
                 # Par completo (frente e verso)
-                pairs.append({
-                    'front': downloaded_files[i],
-                    'back': downloaded_files[i + 1]
-                })
+                back = downloaded_files.get(back_img['id'])
+                if not back:
+                    # Sem o verso o disco não é catalogado: como a frente
+                    # ainda não está na planilha, o próximo scan tenta de novo
+                    logger.error(
+                        f"Verso {back_img['name']} não pôde ser baixado, "
+                        f"disco de {front['name']} ignorado"
+                    )
+                    continue
             else:
                 # Imagem sozinha (apenas frente)
-                logger.warning(f"Imagem sem par: {downloaded_files[i]['name']}")
-                pairs.append({
-                    'front': downloaded_files[i],
-                    'back': None
-                })
+                logger.warning(f"Imagem sem par: {front['name']}")
+                back = None
+            
+            pairs.append({'front': front, 'back': back})
         
         logger.info(f"Total de {len(pairs)} discos identificados")
         return pairs
@@ -149,13 +274,8 @@ class GoogleDriveService:
             return []
         
         # Agrupa em pares
-        pairs = []
-        for i in range(0, len(images), 2):
-            pair = {
-                'index': i // 2 + 1,
-                'frente': images[i] if i < len(images) else None,
-                'verso': images[i + 1] if i + 1 < len(images) else None
-            }
-            pairs.append(pair)
-        
-        return pairs
\ No newline at end of file
+        it = iter(images)
+        return [
+            {'index': index, 'frente': front, 'verso': back}
+            for index, (front, back) in enumerate(zip_longest(it, it), 1)
+        ]
\ No newline at end of file
@@ -1,43 +1,70 @@
-from typing import List, Dict, Optional
+import hashlib
+import re
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime
 from src.services.google_auth import GoogleAuthService
 from src.models.vinyl import Vinyl
-from src.utils.config import GOOGLE_SHEETS_ID, SHEET_NAME
+from src.utils import config
 from src.utils.logger import logger
 
+# Limite de intervalos por batchGet (mantém a URL da requisição curta)
+MAX_RANGES_PER_REQUEST = 100
+
+# Cabeçalhos da planilha, na ordem das colunas A:L
+HEADERS = (
+    "#", "Nome", "Artista", "Ano", "Descrição", "Condição",
+    "Preço", "Post Venda", "Status", "imagem1", "imagem2",
+    "Data Publicação"
+)
+_NUM_COLUMNS = len(HEADERS)
+
+# Primeira linha de um intervalo como "'Página1'!A5:L7"
+_RANGE_START_ROW_RE = re.compile(r'![A-Z]+(\d+)')
 
 class GoogleSheetsService:
     """Serviço para interagir com Google Sheets"""
     
-    def __init__(self):
-        self.auth_service = GoogleAuthService()
+    def __init__(self, auth_service: Optional[GoogleAuthService] = None):
+        # Por padrão reaproveita a autenticação já feita no processo
+        self.auth_service = auth_service or GoogleAuthService.get_instance()
         self.sheets_service = self.auth_service.get_sheets_service()
-        self.spreadsheet_id = GOOGLE_SHEETS_ID
-        self.sheet_name = SHEET_NAME
+        self.spreadsheet_id = config.GOOGLE_SHEETS_ID
+        self.sheet_name = config.SHEET_NAME
+        # Mapa {ID do disco: linha}, carregado sob demanda
+        self._id_index: Optional[Dict[str, int]] = None
+        # ID da aba, obtido em initialize_sheet ou no primeiro uso
+        self._sheet_id: Optional[int] = None
     
     def _get_headers(self) -> List[str]:
         """Retorna os cabeçalhos da planilha"""
-        return [
-            "#", "Nome", "Artista", "Ano", "Descrição", "Condição", 
-            "Preço", "Post Venda", "Status", "imagem1", "imagem2", 
-            "Data Publicação"
-        ]
+        return list(HEADERS)
+    
+    def _row_to_dict(self, row: List[str], row_index: int) -> Dict:
+        """Converte uma linha da planilha em dict, completando as colunas vazias"""
+        # Linhas com células finais vazias vêm mais curtas da API
+        vinyl_dict = dict(zip(HEADERS, row + [""] * (_NUM_COLUMNS - len(row))))
+        vinyl_dict['row_index'] = row_index
+        return vinyl_dict
     
     def initialize_sheet(self):
         """Inicializa a planilha com cabeçalhos se necessário"""
         try:
-            # Verifica se a planilha existe
+            # Verifica se a planilha existe (guardando o ID da aba)
             result = self.sheets_service.spreadsheets().get(
-                spreadsheetId=self.spreadsheet_id
+                spreadsheetId=self.spreadsheet_id,
+                fields='sheets.properties(sheetId,title)'
             ).execute()
             
-            sheets = result.get('sheets', [])
-            sheet_exists = any(
-                sheet['properties']['title'] == self.sheet_name 
-                for sheet in sheets
+            self._sheet_id = next(
+                (
+                    sheet['properties']['sheetId']
+                    for sheet in result.get('sheets', [])
+                    if sheet['properties']['title'] == self.sheet_name
+                ),
+                None
             )
             
-            if not sheet_exists:
+            if self._sheet_id is None:
                 # Cria a aba
                 request = {
                     'addSheet': {
@@ -46,34 +73,30 @@ class GoogleSheetsService:
                         }
                     }
                 }
-                self.sheets_service.spreadsheets().batchUpdate(
+                result = self.sheets_service.spreadsheets().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
                     body={'requests': [request]}
                 ).execute()
+                self._sheet_id = result['replies'][0]['addSheet']['properties']['sheetId']
                 logger.info(f"Aba '{self.sheet_name}' criada")
-            
-            # Verifica se há cabeçalhos
-            range_name = f"{self.sheet_name}!A1:L1"
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
+                
+                # Aba nova está vazia: não precisa verificar os cabeçalhos
+                values = []
+            else:
+                # Verifica se há cabeçalhos
+                result = self.sheets_service.spreadsheets().values().get(
+                    spreadsheetId=self.spreadsheet_id,
+                    range=f"{self.sheet_name}!A1:L1"
+                ).execute()
+                values = result.get('values', [])
             
             if not values:
-                # Adiciona cabeçalhos
-                headers = [self._get_headers()]
-                self.sheets_service.spreadsheets().values().update(
+                # Adiciona e formata cabeçalhos em uma única requisição
+                self.sheets_service.spreadsheets().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
-                    range=range_name,
-                    valueInputOption='RAW',
-                    body={'values': headers}
+                    body={'requests': self._header_requests()}
                 ).execute()
                 logger.info("Cabeçalhos adicionados à planilha")
-                
-                # Formata cabeçalhos
-                self._format_headers()
             
             return True
             
@@ -81,13 +104,30 @@ class GoogleSheetsService:
             logger.error(f"Erro ao inicializar planilha: {e}")
             raise
     
-    def _format_headers(self):
-        """Formata os cabeçalhos da planilha"""
-        try:
-            requests = [{
+    def _header_requests(self) -> List[Dict]:
+        """Requisições de batchUpdate que escrevem e formatam os cabeçalhos"""
+        sheet_id = self._get_sheet_id()
+        return [
+            {
+                'updateCells': {
+                    'start': {
+                        'sheetId': sheet_id,
+                        'rowIndex': 0,
+                        'columnIndex': 0
+                    },
+                    'rows': [{
+                        'values': [
+                            {'userEnteredValue': {'stringValue': header}}
+                            for header in HEADERS
+                        ]
+                    }],
+                    'fields': 'userEnteredValue'
+                }
+            },
+            {
                 'repeatCell': {
                     'range': {
-                        'sheetId': self._get_sheet_id(),
+                        'sheetId': sheet_id,
                         'startRowIndex': 0,
                         'endRowIndex': 1
                     },
@@ -110,44 +150,65 @@ class GoogleSheetsService:
                     },
                     'fields': 'userEnteredFormat(backgroundColor,textFormat)'
                 }
-            }]
-            
-            self.sheets_service.spreadsheets().batchUpdate(
+            }
+        ]
+    
+    def _get_sheet_id(self) -> int:
+        """Obtém o ID da aba (consultado uma única vez)"""
+        if self._sheet_id is None:
+            result = self.sheets_service.spreadsheets().get(
                 spreadsheetId=self.spreadsheet_id,
-                body={'requests': requests}
+                fields='sheets.properties(sheetId,title)'
             ).execute()
             
-        except Exception as e:
-            logger.warning(f"Erro ao formatar cabeçalhos: {e}")
-    
-    def _get_sheet_id(self) -> int:
-        """Obtém o ID da aba"""
-        result = self.sheets_service.spreadsheets().get(
-            spreadsheetId=self.spreadsheet_id
-        ).execute()
-        
-        for sheet in result['sheets']:
-            if sheet['properties']['title'] == self.sheet_name:
-                return sheet['properties']['sheetId']
+            self._sheet_id = next(
+                (
+                    sheet['properties']['sheetId']
+                    for sheet in result['sheets']
+                    if sheet['properties']['title'] == self.sheet_name
+                ),
+                0
+            )
         
-        return 0
+        return self._sheet_id
     
     def _generate_vinyl_id(self, vinyl: Vinyl) -> str:
         """Gera ID único baseado no nome e artista"""
-        import hashlib
-        text = f"{vinyl.nome}_{vinyl.artista}".lower().replace(" ", "_")
+        text = f"{vinyl.nome}_{vinyl.artista}".lower()
+        
+        if config.VINYL_ID_HASH == "blake2b":
+            # Hash de 4 bytes (8 caracteres hex), sem a troca de espaços
+            return hashlib.blake2b(text.encode(), digest_size=4).hexdigest().upper()
+        
+        text = text.replace(" ", "_")
         # Gera hash MD5 dos primeiros 8 caracteres
         hash_obj = hashlib.md5(text.encode())
         return hash_obj.hexdigest()[:8].upper()
     
+    def _vinyl_row(self, vinyl: Vinyl) -> List[str]:
+        """Converte um disco em uma linha da planilha, na ordem dos cabeçalhos"""
+        vinyl_data = vinyl.to_dict()
+        return [vinyl_data.get(header, "") for header in HEADERS]
+    
+    def _get_id_index(self) -> Dict[str, int]:
+        """Retorna o mapa {ID: linha}, lendo apenas a coluna de IDs na primeira vez"""
+        if self._id_index is None:
+            result = self.sheets_service.spreadsheets().values().get(
+                spreadsheetId=self.spreadsheet_id,
+                range=f"{self.sheet_name}!A2:A"
+            ).execute()
+            
+            self._id_index = {
+                value[0]: i + 2  # +2 por causa do cabeçalho e índice 0
+                for i, value in enumerate(result.get('values', []))
+                if value and value[0]
+            }
+        return self._id_index
+    
     def find_vinyl_by_id(self, vinyl_id: str) -> Optional[int]:
         """Busca um vinil por ID e retorna o número da linha (None se não encontrado)"""
         try:
-            all_vinyls = self.get_all_vinyls()
-            for i, vinyl_data in enumerate(all_vinyls):
-                if vinyl_data.get('#', '') == vinyl_id:
-                    return i + 2  # +2 por causa do cabeçalho e índice 0
-            return None
+            return self._get_id_index().get(vinyl_id)
         except Exception as e:
             logger.error(f"Erro ao buscar vinil por ID: {e}")
             return None
@@ -155,11 +216,7 @@ class GoogleSheetsService:
     def update_vinyl(self, row_index: int, vinyl: Vinyl) -> bool:
         """Atualiza um vinil existente na linha especificada"""
         try:
-            vinyl_data = vinyl.to_dict()
-            row_data = [[
-                vinyl_data.get(header, "") 
-                for header in self._get_headers()
-            ]]
+            row_data = [self._vinyl_row(vinyl)]
             
             range_name = f"{self.sheet_name}!A{row_index}:L{row_index}"
             self.sheets_service.spreadsheets().values().update(
@@ -169,6 +226,10 @@ class GoogleSheetsService:
                 body={'values': row_data}
             ).execute()
             
+            # Mantém o mapa de IDs em dia sem reler a planilha
+            if self._id_index is not None and vinyl.vinyl_id:
+                self._id_index[vinyl.vinyl_id] = row_index
+            
             logger.info(f"✅ Disco atualizado: {vinyl.nome} - {vinyl.artista}")
             return True
             
@@ -201,103 +262,216 @@ class GoogleSheetsService:
     
     def add_vinyl(self, vinyl: Vinyl) -> bool:
         """Adiciona um novo disco à planilha (método interno)"""
+        return self.append_vinyls([vinyl])
+    
+    def append_vinyls(self, vinyls: List[Vinyl]) -> bool:
+        """Adiciona vários discos novos ao final da planilha em uma única requisição"""
+        if not vinyls:
+            return True
+        
         try:
-            # Busca próxima linha vazia
-            range_name = f"{self.sheet_name}!A:A"
-            result = self.sheets_service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            next_row = len(values) + 1
+            rows = [self._vinyl_row(vinyl) for vinyl in vinyls]
             
-            # Prepara dados
-            vinyl_data = vinyl.to_dict()
-            row_data = [[
-                vinyl_data.get(header, "") 
-                for header in self._get_headers()
-            ]]
-            
-            # Adiciona à planilha
-            range_name = f"{self.sheet_name}!A{next_row}:L{next_row}"
-            self.sheets_service.spreadsheets().values().update(
+            result = self.sheets_service.spreadsheets().values().append(
                 spreadsheetId=self.spreadsheet_id,
-                range=range_name,
+                range=f"{self.sheet_name}!A:L",
                 valueInputOption='RAW',
-                body={'values': row_data}
+                insertDataOption='INSERT_ROWS',
+                body={'values': rows}
             ).execute()
             
-            logger.info(f"✅ Disco adicionado: {vinyl.nome} - {vinyl.artista}")
+            self._index_appended_rows(result, vinyls)
+            
+            for vinyl in vinyls:
+                logger.info(f"✅ Disco adicionado: {vinyl.nome} - {vinyl.artista}")
             return True
             
         except Exception as e:
-            logger.error(f"Erro ao adicionar disco: {e}")
+            logger.error(f"Erro ao adicionar discos: {e}")
             return False
     
-    def get_pending_vinyls(self) -> List[Dict]:
-        """Retorna discos com status 'pendente' para publicação"""
+    def _index_appended_rows(self, append_result: Dict, vinyls: List[Vinyl]):
+        """Inclui no mapa de IDs as linhas recém-anexadas, sem reler a planilha"""
+        if self._id_index is None:
+            return
+        
+        updated_range = append_result.get('updates', {}).get('updatedRange', '')
+        match = _RANGE_START_ROW_RE.search(updated_range)
+        if not match:
+            # Não dá para saber onde as linhas entraram: relê na próxima consulta
+            self._id_index = None
+            return
+        
+        first_row = int(match.group(1))
+        for offset, vinyl in enumerate(vinyls):
+            if vinyl.vinyl_id:
+                self._id_index[vinyl.vinyl_id] = first_row + offset
+    
+    def bulk_upsert(self, vinyls: List[Vinyl]) -> int:
+        """
+        Adiciona ou atualiza vários discos de uma vez
+        
+        Discos existentes são atualizados com um único batchUpdate e os
+        novos são anexados com um único append.
+        
+        Returns:
+            Número de discos gravados
+        """
+        if not vinyls:
+            return 0
+        
         try:
-            range_name = f"{self.sheet_name}!A2:L"
-            result = self.sheets_service.spreadsheets().values().get(
+            id_index = self._get_id_index()
+        except Exception as e:
+            logger.error(f"Erro ao buscar IDs da planilha: {e}")
+            self._log_unsaved(vinyls)
+            return 0
+        
+        updates: Dict[str, List[List[str]]] = {}
+        updated: Dict[str, Vinyl] = {}
+        new_vinyls: Dict[str, Vinyl] = {}
+        
+        for vinyl in vinyls:
+            # Gera ID se não existir
+            if not vinyl.vinyl_id:
+                vinyl.vinyl_id = self._generate_vinyl_id(vinyl)
+            
+            existing_row = id_index.get(vinyl.vinyl_id)
+            if existing_row:
+                logger.info(f"🔄 Disco já existe (ID: {vinyl.vinyl_id}), atualizando...")
+                updates[f"{self.sheet_name}!A{existing_row}:L{existing_row}"] = [self._vinyl_row(vinyl)]
+                # Repetições no mesmo lote contam uma vez só
+                updated[vinyl.vinyl_id] = vinyl
+            else:
+                # Repetições no mesmo lote ficam com a última versão
+                new_vinyls[vinyl.vinyl_id] = vinyl
+        
+        saved_count = 0
+        
+        if updates:
+            if self.batch_update_values(updates):
+                saved_count += len(updated)
+                for vinyl in updated.values():
+                    logger.info(f"✅ Disco atualizado: {vinyl.nome} - {vinyl.artista}")
+            else:
+                self._log_unsaved(updated.values())
+        
+        if new_vinyls:
+            logger.info(f"➕ {len(new_vinyls)} discos novos, adicionando...")
+            if self.append_vinyls(list(new_vinyls.values())):
+                saved_count += len(new_vinyls)
+            else:
+                self._log_unsaved(new_vinyls.values())
+        
+        return saved_count
+    
+    def _log_unsaved(self, vinyls: Iterable[Vinyl]):
+        """Registra os discos que não foram gravados, para recuperação manual"""
+        for vinyl in vinyls:
+            logger.error(
+                f"❌ Disco não gravado: {vinyl.nome} - {vinyl.artista} "
+                f"(imagens: {vinyl.imagem1_url} {vinyl.imagem2_url or ''})"
+            )
+    
+    def iter_by_status(self, status: str) -> Iterator[Dict]:
+        """
+        Itera sobre os discos com o status informado
+        
+        Lê primeiro somente a coluna de status e depois busca apenas as
+        linhas correspondentes, em vez de baixar a planilha inteira. As
+        linhas são entregues a cada batchGet, sem acumular o resultado.
+        """
+        result = self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f"{self.sheet_name}!I2:I"
+        ).execute()
+        
+        status = status.lower()
+        rows = [
+            i + 2  # +2 por causa do cabeçalho e índice 0
+            for i, value in enumerate(result.get('values', []))
+            if value and value[0].lower() == status
+        ]
+        
+        if not rows:
+            return
+        
+        # Agrupa linhas consecutivas em intervalos (first, last)
+        blocks = []
+        first = last = rows[0]
+        for row in rows[1:]:
+            if row != last + 1:
+                blocks.append((first, last))
+                first = row
+            last = row
+        blocks.append((first, last))
+        
+        for i in range(0, len(blocks), MAX_RANGES_PER_REQUEST):
+            chunk = blocks[i:i + MAX_RANGES_PER_REQUEST]
+            result = self.sheets_service.spreadsheets().values().batchGet(
                 spreadsheetId=self.spreadsheet_id,
-                range=range_name
+                ranges=[f"{self.sheet_name}!A{a}:L{b}" for a, b in chunk],
+                fields='valueRanges(values)'
             ).execute()
             
-            values = result.get('values', [])
-            headers = self._get_headers()
-            
-            pending = []
-            for i, row in enumerate(values):
-                # Garante que a linha tenha todos os campos
-                while len(row) < len(headers):
-                    row.append("")
-                
-                vinyl_dict = dict(zip(headers, row))
-                
-                # Verifica se está pendente e tem as informações mínimas
-                if (vinyl_dict.get('Status', '').lower() == 'pendente' and
-                    vinyl_dict.get('Nome') and 
-                    vinyl_dict.get('Post Venda')):
-                    
-                    vinyl_dict['row_index'] = i + 2  # +2 por causa do cabeçalho e índice 0
-                    pending.append(vinyl_dict)
-            
-            logger.info(f"Encontrados {len(pending)} discos pendentes para publicação")
-            return pending
+            for (first, _), value_range in zip(chunk, result.get('valueRanges', [])):
+                for offset, row in enumerate(value_range.get('values', [])):
+                    yield self._row_to_dict(row, first + offset)
+    
+    def query_by_status(self, status: str) -> List[Dict]:
+        """Retorna apenas os discos com o status informado (ver iter_by_status)"""
+        try:
+            return list(self.iter_by_status(status))
             
         except Exception as e:
-            logger.error(f"Erro ao buscar discos pendentes: {e}")
+            logger.error(f"Erro ao buscar discos por status: {e}")
             return []
     
     def update_status(self, row_index: int, status: str, published_date: datetime = None):
-        """Atualiza o status de um disco na planilha"""
+        """Atualiza o status (e a data de publicação) de um disco em uma única requisição"""
+        return self.update_statuses([(row_index, status, published_date)])
+    
+    def update_statuses(self, updates: List[Tuple[int, str, Optional[datetime]]]) -> bool:
+        """
+        Atualiza o status de vários discos em uma única requisição
+        
+        Args:
+            updates: Tuplas (linha, status, data de publicação ou None)
+        """
+        values = {}
+        for row_index, status, published_date in updates:
+            values[f"{self.sheet_name}!I{row_index}"] = [[status]]
+            if published_date:
+                date_str = published_date.strftime("%d/%m/%Y %H:%M")
+                values[f"{self.sheet_name}!L{row_index}"] = [[date_str]]
+        
+        if not self.batch_update_values(values):
+            return False
+        
+        for row_index, status, _ in updates:
+            logger.info(f"Status atualizado na linha {row_index}: {status}")
+        return True
+    
+    def batch_update_values(self, updates: Dict[str, List[List]]) -> bool:
+        """Atualiza vários intervalos da planilha em uma única requisição"""
+        if not updates:
+            return True
+        
         try:
-            # Atualiza status (coluna I, pois agora # é a primeira)
-            status_range = f"{self.sheet_name}!I{row_index}"
-            self.sheets_service.spreadsheets().values().update(
+            data = [
+                {'range': range_name, 'values': values}
+                for range_name, values in updates.items()
+            ]
+            self.sheets_service.spreadsheets().values().batchUpdate(
                 spreadsheetId=self.spreadsheet_id,
-                range=status_range,
-                valueInputOption='RAW',
-                body={'values': [[status]]}
+                body={'valueInputOption': 'RAW', 'data': data}
             ).execute()
             
-            # Atualiza data de publicação se fornecida (agora na coluna L)
-            if published_date:
-                date_range = f"{self.sheet_name}!L{row_index}"
-                date_str = published_date.strftime("%d/%m/%Y %H:%M")
-                self.sheets_service.spreadsheets().values().update(
-                    spreadsheetId=self.spreadsheet_id,
-                    range=date_range,
-                    valueInputOption='RAW',
-                    body={'values': [[date_str]]}
-                ).execute()
-            
-            logger.info(f"Status atualizado na linha {row_index}: {status}")
+            logger.debug(f"{len(data)} intervalos atualizados em lote")
             return True
             
         except Exception as e:
-            logger.error(f"Erro ao atualizar status: {e}")
+            logger.error(f"Erro ao atualizar planilha em lote: {e}")
             return False
     
     def get_all_vinyls(self) -> List[Dict]:
@@ -310,19 +484,8 @@ class GoogleSheetsService:
             ).execute()
             
             values = result.get('values', [])
-            headers = self._get_headers()
-            
-            vinyls = []
-            for i, row in enumerate(values):
-                # Garante que a linha tenha todos os campos
-                while len(row) < len(headers):
-                    row.append("")
-                
-                vinyl_dict = dict(zip(headers, row))
-                vinyl_dict['row_index'] = i + 2
-                vinyls.append(vinyl_dict)
             
-            return vinyls
+            return [self._row_to_dict(row, i + 2) for i, row in enumerate(values)]
             
         except Exception as e:
             logger.error(f"Erro ao buscar todos os discos: {e}")
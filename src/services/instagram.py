@@ -1,9 +1,33 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+import requests
 from instagrapi import Client
-from instagrapi.types import Media
+from instagrapi.exceptions import (
+    AlbumConfigureError, ClientConnectionError, ClientRequestTimeout,
+    ClientThrottledError, LoginRequired, PleaseWaitFewMinutes
+)
+from instagrapi.extractors import extract_media_v1
+from instagrapi.types import Media, User
+from instagrapi.utils import dumps
+from src.utils import config
 from src.utils.logger import logger
 
+T = TypeVar("T")
+
+# Tentativas por chamada à API antes de desistir
+_MAX_ATTEMPTS = 3
+# Espera (segundos) quando o Instagram pede para desacelerar
+_THROTTLE_WAIT = 60
+# Falhas de rede passageiras (o upload de fotos usa o requests diretamente)
+_TRANSIENT_ERRORS = (
+    ClientConnectionError, ClientRequestTimeout,
+    requests.ConnectionError, requests.Timeout
+)
+
 
 class InstagramService:
     """Serviço para publicação no Instagram"""
@@ -11,20 +35,194 @@ class InstagramService:
     def __init__(self, username: str, password: str):
         self.username = username
         self.password = password
-        self.client = Client()
-        self._login()
+        self._client = Client()
+        self._logged_in = False
+        # Evita logins simultâneos quando várias threads perdem a sessão
+        self._login_lock = threading.Lock()
+        self._login_count = 0
+        # Sessão salva por conta, para não misturar cookies de contas diferentes
+        self.session_file = config.CREDENTIALS_DIR / f"{username}.session.json"
+        self._user_id: Optional[str] = None
+        # Momento (time.monotonic) do último envio, para espaçar os posts
+        self._last_post_ts: Optional[float] = None
+    
+    @property
+    def client(self) -> Client:
+        """Cliente do instagrapi; o login acontece no primeiro acesso"""
+        if not self._logged_in:
+            self._login()
+        return self._client
+    
+    def ensure_login(self) -> bool:
+        """Faz o login, se ainda não foi feito. Retorna False se falhar"""
+        try:
+            return self.client is not None
+        except Exception:
+            return False
+    
+    @property
+    def user_id(self) -> str:
+        """ID da conta logada (resolvido uma única vez)"""
+        if self._user_id is None:
+            # O ID vem nos cookies da sessão; a consulta à API é só o fallback
+            user_id = self.client.user_id or self.client.user_id_from_username(self.username)
+            self._user_id = str(user_id)
+        return self._user_id
+    
+    def _restore_session(self) -> bool:
+        """
+        Tenta reaproveitar a sessão salva em disco, validando-a com uma
+        chamada barata. Retorna False se for preciso fazer login completo.
+        """
+        try:
+            self._client.load_settings(self.session_file)
+            # Com sessão carregada o login não refaz a autenticação completa
+            self._client.login(self.username, self.password)
+            self._client.get_timeline_feed()
+            
+            self._client.dump_settings(self.session_file)
+            logger.info("✅ Sessão do Instagram reaproveitada (@%s)", self.username)
+            return True
+            
+        except LoginRequired:
+            logger.warning("Sessão do Instagram expirada, refazendo login...")
+            # Mantém os identificadores do dispositivo no novo login
+            uuids = self._client.get_settings()["uuids"]
+            self._client.set_settings({})
+            self._client.set_uuids(uuids)
+            self.session_file.unlink(missing_ok=True)
+            return False
+            
+        except Exception as e:
+            logger.warning("Sessão do Instagram inválida, ignorando: %s", e)
+            self._client = Client()
+            return False
     
     def _login(self):
-        """Realiza login no Instagram"""
+        """Realiza login no Instagram, reaproveitando a sessão salva em disco"""
         try:
-            # Tenta fazer login
-            logger.info(f"Fazendo login no Instagram como @{self.username}...")
-            self.client.login(self.username, self.password)
-            logger.info("✅ Login realizado com sucesso")
+            if not (self.session_file.exists() and self._restore_session()):
+                logger.info("Fazendo login no Instagram como @%s...", self.username)
+                self._client.login(self.username, self.password)
+                self._client.dump_settings(self.session_file)
+                logger.info("✅ Login realizado com sucesso")
+            
+            self._logged_in = True
+            self._login_count += 1
         except Exception as e:
-            logger.error(f"❌ Erro ao fazer login: {e}")
+            logger.error("❌ Erro ao fazer login: %s", e)
             raise
     
+    def _wait_post_interval(self):
+        """
+        Aguarda o intervalo mínimo desde o último post (sorteado em
+        INSTAGRAM_POST_DELAY), evitando rajadas que disparam o rate limit
+        """
+        if self._last_post_ts is None:
+            return
+        
+        interval = random.uniform(*config.INSTAGRAM_POST_DELAY)
+        wait = self._last_post_ts + interval - time.monotonic()
+        if wait > 0:
+            logger.info("⏳ Aguardando %.0fs antes do próximo post...", wait)
+            time.sleep(wait)
+    
+    def _relogin(self, login_count: int):
+        """
+        Refaz o login após a sessão expirar; se outra thread já refez o
+        login desde login_count, apenas reaproveita a nova sessão
+        """
+        with self._login_lock:
+            if self._login_count == login_count:
+                self._logged_in = False
+                self._login()
+    
+    def _with_retry(self, action: Callable[[], T], retry_transient: bool = True) -> T:
+        """
+        Executa uma chamada à API tratando as falhas recuperáveis
+        
+        Falhas de rede são repetidas com espera exponencial, sessão expirada
+        refaz o login e throttling aguarda antes de tentar de novo; demais
+        erros sobem imediatamente.
+        
+        Args:
+            action: Chamada a executar
+            retry_transient: Repete falhas de rede. Use False em chamadas que
+                publicam, pois a requisição pode ter chegado ao Instagram
+        """
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            last_attempt = attempt == _MAX_ATTEMPTS
+            login_count = self._login_count
+            try:
+                return action()
+            except _TRANSIENT_ERRORS as e:
+                if not retry_transient or last_attempt:
+                    raise
+                wait = 2 ** attempt
+                logger.warning("Falha de conexão com o Instagram (%s), nova tentativa em %ss...", e, wait)
+                time.sleep(wait)
+            except LoginRequired:
+                if last_attempt:
+                    raise
+                logger.warning("Sessão do Instagram expirada, refazendo login...")
+                self._relogin(login_count)
+            except (ClientThrottledError, PleaseWaitFewMinutes) as e:
+                if last_attempt:
+                    raise
+                logger.warning("Instagram pediu para desacelerar (%s), aguardando %ss...", e, _THROTTLE_WAIT)
+                time.sleep(_THROTTLE_WAIT)
+    
+    def _upload_album_photo(self, path: str, upload_id: str) -> Dict:
+        """Envia uma foto do álbum e retorna o item (child) usado no configure"""
+        upload_id, width, height = self._with_retry(
+            lambda: self.client.photo_rupload(Path(path), upload_id=upload_id, to_album=True)
+        )
+        return {
+            "upload_id": upload_id,
+            "edits": dumps({
+                "crop_original_size": [width, height],
+                "crop_center": [0.0, -0.0],
+                "crop_zoom": 1.0
+            }),
+            "extra": dumps({"source_width": width, "source_height": height}),
+            "scene_capture_type": "",
+            "scene_type": None
+        }
+    
+    def _album_upload(self, images: List[str], caption: str, configure_timeout: int = 3) -> Media:
+        """
+        Equivalente ao album_upload do instagrapi, mas enviando as fotos em
+        paralelo: o tempo de envio passa a ser o da foto mais lenta, não a
+        soma de todas. O álbum é configurado com uma única chamada no final.
+        """
+        # IDs explícitos: o padrão do instagrapi (milissegundo atual) pode
+        # se repetir entre envios simultâneos
+        base_id = int(time.time() * 1000)
+        upload_ids = [str(base_id + i) for i in range(len(images))]
+        
+        with ThreadPoolExecutor(max_workers=config.INSTAGRAM_UPLOAD_WORKERS) as executor:
+            children = list(executor.map(self._upload_album_photo, images, upload_ids))
+        
+        # Mesmo fluxo do instagrapi: aguarda o processamento das fotos
+        for _ in range(50):
+            time.sleep(configure_timeout)
+            try:
+                configured = self._with_retry(
+                    lambda: self.client.album_configure(children, caption),
+                    retry_transient=False
+                )
+            except Exception as e:
+                if "Transcode not finished yet" in str(e):
+                    time.sleep(configure_timeout)
+                    continue
+                raise
+            
+            if configured:
+                self.client.expose()
+                return extract_media_v1(configured.get("media"))
+        
+        raise AlbumConfigureError(response=self.client.last_response, **self.client.last_json)
+    
     def post_album(
         self, 
         images: List[Path], 
@@ -56,33 +254,36 @@ class InstagramService:
                 if img_path and img_path.exists():
                     valid_images.append(str(img_path))
                 else:
-                    logger.warning(f"Imagem não encontrada: {img_path}")
+                    logger.warning("Imagem não encontrada: %s", img_path)
             
             if not valid_images:
                 logger.error("Nenhuma imagem válida encontrada")
                 return None
             
+            self._wait_post_interval()
+            
             # Posta o álbum
-            if len(valid_images) == 1:
-                # Post único
-                logger.info("Postando imagem única...")
-                media = self.client.photo_upload(
-                    valid_images[0],
-                    caption=caption
-                )
-            else:
-                # Carousel
-                logger.info(f"Postando álbum com {len(valid_images)} imagens...")
-                media = self.client.album_upload(
-                    valid_images,
-                    caption=caption
-                )
+            try:
+                if len(valid_images) == 1:
+                    # Post único
+                    logger.info("Postando imagem única...")
+                    media = self._with_retry(
+                        lambda: self.client.photo_upload(valid_images[0], caption=caption),
+                        retry_transient=False
+                    )
+                else:
+                    # Carousel
+                    logger.info("Postando álbum com %s imagens...", len(valid_images))
+                    media = self._album_upload(valid_images, caption)
+            finally:
+                # Tentativas que falharam também contam para o intervalo
+                self._last_post_ts = time.monotonic()
             
-            logger.info(f"✅ Post publicado com sucesso! ID: {media.pk}")
+            logger.info("✅ Post publicado com sucesso! ID: %s", media.pk)
             return media
             
         except Exception as e:
-            logger.error(f"❌ Erro ao publicar no Instagram: {e}")
+            logger.error("❌ Erro ao publicar no Instagram: %s", e)
             return None
     
     def post_single_image(
@@ -102,23 +303,70 @@ class InstagramService:
         """
         return self.post_album([image_path], caption)
     
-    def check_connection(self) -> bool:
-        """Verifica se está conectado ao Instagram"""
+    def check_connection(self, deep: bool = False) -> bool:
+        """
+        Verifica se está conectado ao Instagram
+        
+        Por padrão confere apenas a sessão local (usuário nos cookies), sem
+        chamada à API; deep=True consulta a conta no Instagram.
+        """
         try:
+            if not deep:
+                if not self.client.user_id:
+                    logger.error("❌ Não conectado: sessão sem usuário")
+                    return False
+                logger.info("✅ Sessão ativa como @%s", self.username)
+                return True
+            
             # Tenta obter informações do próprio usuário
-            user = self.client.user_info_by_username(self.username)
-            logger.info(f"✅ Conectado como @{user.username}")
+            user = self._with_retry(lambda: self.client.user_info(self.user_id))
+            logger.info("✅ Conectado como @%s", user.username)
             return True
         except Exception as e:
-            logger.error(f"❌ Não conectado: {e}")
+            logger.error("❌ Não conectado: %s", e)
             return False
     
     def get_recent_posts(self, limit: int = 10) -> List[Media]:
         """Retorna posts recentes do usuário"""
         try:
-            user_id = self.client.user_id_from_username(self.username)
-            medias = self.client.user_medias(user_id, amount=limit)
+            medias = self._with_retry(
+                lambda: self.client.user_medias(self.user_id, amount=limit)
+            )
             return medias
         except Exception as e:
-            logger.error(f"Erro ao buscar posts recentes: {e}")
-            return []
\ No newline at end of file
+            logger.error("Erro ao buscar posts recentes: %s", e)
+            return []
+    
+    def get_profile_summary(self, limit: int = 10) -> Tuple[Optional[User], List[Media]]:
+        """
+        Retorna os dados da conta e os posts recentes, buscados ao mesmo
+        tempo (a espera é a da chamada mais lenta, não a soma das duas)
+        """
+        # Login e ID resolvidos antes de abrir as threads
+        try:
+            user_id = self.user_id
+        except Exception as e:
+            logger.error("Erro ao buscar dados da conta: %s", e)
+            return None, []
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            user_future = executor.submit(
+                self._with_retry, lambda: self.client.user_info(user_id)
+            )
+            medias_future = executor.submit(
+                self._with_retry, lambda: self.client.user_medias(user_id, amount=limit)
+            )
+        
+        try:
+            user = user_future.result()
+        except Exception as e:
+            logger.error("Erro ao buscar dados da conta: %s", e)
+            user = None
+        
+        try:
+            medias = medias_future.result()
+        except Exception as e:
+            logger.error("Erro ao buscar posts recentes: %s", e)
+            medias = []
+        
+        return user, medias
@@ -1,37 +1,83 @@
 import os
+from functools import lru_cache
 from pathlib import Path
+from types import SimpleNamespace
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).parent.parent.parent
 
-# Carrega variáveis de ambiente
-load_dotenv(dotenv_path=BASE_DIR / ".env", override=True)
 
-# Diretórios
+@lru_cache(maxsize=1)
+def get_config() -> SimpleNamespace:
+    """
+    Carrega as configurações da aplicação (uma única vez por processo)
 
-DOWNLOADS_DIR = BASE_DIR / "downloads"
-CREDENTIALS_DIR = BASE_DIR / "credentials"
-LOGS_DIR = BASE_DIR / "logs"
+    A leitura do .env e a criação dos diretórios acontecem na primeira
+    chamada, não na importação do módulo.
+    """
+    # Carrega variáveis de ambiente
+    load_dotenv(dotenv_path=BASE_DIR / ".env", override=True)
 
-# Criar diretórios se não existirem
-DOWNLOADS_DIR.mkdir(exist_ok=True)
-CREDENTIALS_DIR.mkdir(exist_ok=True)
-LOGS_DIR.mkdir(exist_ok=True)
+    # Diretórios
 
-# Google APIs
-GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
-GOOGLE_SHEETS_ID = os.getenv("GOOGLE_SHEETS_ID")
-GOOGLE_CREDENTIALS_FILE = CREDENTIALS_DIR / "credentials.json"
-GOOGLE_TOKEN_FILE = CREDENTIALS_DIR / "token.json"
+    DOWNLOADS_DIR = BASE_DIR / "downloads"
+    CREDENTIALS_DIR = BASE_DIR / "credentials"
+    LOGS_DIR = BASE_DIR / "logs"
+    CACHE_DIR = BASE_DIR / ".cache"
+    # Arquivos temporários de publicação ficam em tmpfs quando disponível
+    TEMP_IMAGES_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    # Folga (bytes) mantida livre em TEMP_IMAGES_DIR; abaixo disso usa o temp padrão
+    TEMP_IMAGES_MIN_FREE = 16 * 1024 * 1024
 
-# Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # Criar diretórios se não existirem
+    DOWNLOADS_DIR.mkdir(exist_ok=True)
+    CREDENTIALS_DIR.mkdir(exist_ok=True)
+    LOGS_DIR.mkdir(exist_ok=True)
+    CACHE_DIR.mkdir(exist_ok=True)
 
-# Instagram
-INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
-INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")
+    # Google APIs
+    GOOGLE_DRIVE_FOLDER_ID = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
+    GOOGLE_SHEETS_ID = os.getenv("GOOGLE_SHEETS_ID")
+    GOOGLE_CREDENTIALS_FILE = CREDENTIALS_DIR / "credentials.json"
+    GOOGLE_TOKEN_FILE = CREDENTIALS_DIR / "token.json"
 
-# Configurações da aplicação
-SHEET_NAME = "Página1"
-BATCH_SIZE = 10  # Número de discos para processar por vez
-IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png"]
+    # Gemini API
+    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    SALES_POST_CACHE_FILE = CACHE_DIR / "sales_posts.db"
+    ANALYSIS_CACHE_FILE = CACHE_DIR / "gemini_analysis.db"
+    # Maior lado (pixels) das imagens usadas na análise; a capa não precisa de mais
+    ANALYSIS_IMAGE_MAX_SIDE = 1024
+
+    # Instagram
+    INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
+    INSTAGRAM_PASSWORD = os.getenv("INSTAGRAM_PASSWORD")
+    INSTAGRAM_UPLOAD_WORKERS = 4  # Fotos de um álbum enviadas simultaneamente
+    # Intervalo mínimo (segundos) entre posts consecutivos, sorteado nesta faixa
+    INSTAGRAM_POST_DELAY = (
+        float(os.getenv("INSTAGRAM_POST_DELAY_MIN", "60")),
+        float(os.getenv("INSTAGRAM_POST_DELAY_MAX", "90"))
+    )
+
+    # Configurações da aplicação
+    SHEET_NAME = "Página1"
+    BATCH_SIZE = 10  # Número de discos para processar por vez
+    SCAN_CONCURRENCY = 8  # Análises simultâneas no Gemini durante o scan
+    DOWNLOAD_WORKERS = 8  # Downloads simultâneos do Google Drive
+    PUBLISH_PREFETCH = 2  # Discos baixados com antecedência durante a publicação
+    # Extensões de imagem aceitas, já nas duas caixas: compare com path.suffix diretamente
+    IMAGE_EXTENSIONS = frozenset({".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG"})
+    # Algoritmo dos IDs dos discos: "md5" (padrão, mantém os IDs já gravados) ou "blake2b"
+    VINYL_ID_HASH = os.getenv("VINYL_ID_HASH", "md5").lower()
+
+    # Todas as constantes acima (nomes em maiúsculas)
+    return SimpleNamespace(**{
+        name: value for name, value in locals().items() if name.isupper()
+    })
+
+
+def __getattr__(name: str):
+    """Mantém `from src.utils.config import NOME` funcionando, via get_config()"""
+    try:
+        return getattr(get_config(), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
@@ -1,33 +1,60 @@
+import atexit
 import logging
-from pathlib import Path
+import logging.handlers
+import queue
+import sys
 from datetime import datetime
-from rich.logging import RichHandler
-from .config import LOGS_DIR
+from functools import lru_cache
+from . import config
 
 
+@lru_cache(maxsize=None)
 def setup_logger(name: str = "vinyl_bot") -> logging.Logger:
-    """Configura e retorna um logger com formatação rica"""
-    
-    # Cria nome do arquivo de log com timestamp
-    log_file = LOGS_DIR / f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
+    """
+    Configura e retorna um logger com formatação rica
     
+    Chamadas repetidas com o mesmo nome devolvem o logger já configurado,
+    sem abrir outro arquivo nem duplicar handlers.
+    """
     # Configura o logger
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
     
-    # Remove handlers existentes
+    # Descarta o handler provisório do logger padrão (ver _SetupOnFirstRecord).
+    # A lista é trocada, não alterada: o registro que disparou a configuração
+    # ainda está sendo distribuído sobre a lista antiga.
+    logger.handlers = [
+        h for h in logger.handlers if not isinstance(h, _SetupOnFirstRecord)
+    ]
+    
+    # Já configurado (por exemplo, fora desta função): não adiciona outros handlers
     if logger.handlers:
-        logger.handlers.clear()
-    
-    # Handler para console com Rich
-    console_handler = RichHandler(
-        rich_tracebacks=True,
-        markup=True,
-        show_time=True,
-        show_level=True
-    )
+        return logger
+    
+    logger.setLevel(logging.DEBUG)
+    
+    # Cria nome do arquivo de log com timestamp
+    # (config só é carregada aqui, na primeira configuração do logger)
+    log_file = config.LOGS_DIR / f"{name}_{datetime.now().strftime('%Y%m%d')}.log"
+    
+    if sys.stdout.isatty():
+        # Handler para console com Rich (importado só aqui: é pesado e só
+        # faz sentido em um terminal)
+        from rich.logging import RichHandler
+        console_handler = RichHandler(
+            rich_tracebacks=True,
+            markup=True,
+            show_time=True,
+            show_level=True
+        )
+        console_format = logging.Formatter("%(message)s")
+    else:
+        # Saída redirecionada (cron, CI): texto simples, sem códigos ANSI
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_format = logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter("%(message)s")
     console_handler.setFormatter(console_format)
     
     # Handler para arquivo
@@ -39,12 +66,50 @@ def setup_logger(name: str = "vinyl_bot") -> logging.Logger:
     )
     file_handler.setFormatter(file_format)
     
+    # Acumula registros em memória e grava no arquivo em blocos; erros
+    # forçam a gravação imediata (e o logging.shutdown grava o restante)
+    buffered_handler = logging.handlers.MemoryHandler(
+        capacity=512,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
+    buffered_handler.setLevel(logging.DEBUG)
+    
+    # O arquivo é gravado por uma thread em segundo plano: quem loga só
+    # enfileira o registro. O console continua síncrono para não
+    # embaralhar os logs com as saídas do CLI.
+    log_queue = queue.SimpleQueue()
+    file_listener = logging.handlers.QueueListener(
+        log_queue, buffered_handler, respect_handler_level=True
+    )
+    file_listener.start()
+    # Esvazia a fila no encerramento do processo
+    atexit.register(file_listener.stop)
+    
     # Adiciona handlers ao logger
     logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     return logger
 
 
-# Logger padrão da aplicação
-logger = setup_logger()
\ No newline at end of file
+class _SetupOnFirstRecord(logging.Handler):
+    """
+    Handler provisório do logger padrão: no primeiro registro emitido chama
+    setup_logger (que o substitui pelos handlers reais) e repassa o registro
+    """
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.logger_name = name
+
+    def emit(self, record: logging.LogRecord):
+        setup_logger(self.logger_name).handle(record)
+
+
+# Logger padrão da aplicação. Importá-lo não lê o .env nem cria diretórios:
+# os handlers (e a configuração) só são montados no primeiro registro.
+logger = logging.getLogger("vinyl_bot")
+logger.setLevel(logging.DEBUG)
+if not logger.handlers:
+    logger.addHandler(_SetupOnFirstRecord(logger.name))